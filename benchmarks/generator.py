@@ -0,0 +1,305 @@
+"""
+Seeded generator of synthetic survey responses, in the same TSV layout as the real survey export.
+
+e.g. python -m benchmarks.generator 100000 benchmarks/data/responses-100k.tsv --skew 1.2 --correlation 0.7
+"""
+
+import argparse
+
+import numpy as np
+
+from constants import *
+
+REGIONS = [
+    "North America",
+    "Southeast Asia",
+    "Europe",
+    "South America",
+    "Oceania",
+    "East Asia",
+    "South Asia",
+    "Middle East",
+    "Central America",
+    "Other",
+    "North Asia and Central Asia",  # renamed when loaded
+    "Africa",
+    NO_RESPONSE
+]
+REGION_WEIGHTS = [30, 20, 18, 9, 6, 3, 3, 2, 2, 2, 1.5, 0.5, 3]
+AGES = ["Under 13", "14-19", "20-24", "25-29", "30-34", "35-39", "40+", NO_RESPONSE]
+AGE_WEIGHTS = [3, 35, 35, 14, 6, 2, 1, 4]
+GENDERS = ["Male", "Female", "Other", NO_RESPONSE]
+GENDER_WEIGHTS = [70, 20, 4, 6]
+
+PLAY_STYLE_VALUES = ["Thumbs", "Index Fingers", "Multiple Fingers (2+ per hand)", "Stylus", "Other"]
+PARTICIPATION_VALUES = ["Game", "Music", "Anime", "Lives (concerts)", "Merchandise", "Other"]
+SEIYUU_VALUES = [
+    "Aiba Aina",
+    "Aimi",
+    "Ohashi Ayaka",
+    "Nishimoto Rimi",
+    "Itou Ayasa",
+    "Sakura Ayane",
+    "Kudou Haruka",
+    "Raychell",
+    "Natsume",
+    "Ozawa Ari",
+    "Other",
+    "I don't have a favorite seiyuu"
+]
+SONGS_ORIGINAL_VALUES = [f"Original Song {i + 1:02d}" for i in range(60)]
+SONGS_COVER_VALUES = [f"Cover Song {i + 1:02d}" for i in range(60)]
+
+# Members of each band, in order of ALL_BANDS; the rest of ALL_CHARACTERS are in no band
+BAND_MEMBERS = [ALL_CHARACTERS[i:i + 5] for i in range(0, 30, 5)] + [ALL_CHARACTERS[30:34]]
+CHARACTER_COLUMNS = [
+    CHARACTER_POPIPA,
+    CHARACTER_ROSELIA,
+    CHARACTER_RAS,
+    CHARACTER_AFTERGLOW,
+    CHARACTER_PASUPARE,
+    CHARACTER_HHW,
+    CHARACTER_GURIGURI
+]  # in order of ALL_BANDS
+
+# Columns of the export, in order; duplicate questions (which Pandas renames) and free text are included,
+# like in the real export
+HEADER = [
+    "Timestamp",
+    "What is your gender?",
+    "What is your gender?",
+    "How old are you?",
+    "How old are you?",
+    REGION,
+    BANDS_MUSIC,
+    BANDS_CHARA,
+    CHARACTERS,
+    CHARACTER_REASONS,
+    *CHARACTER_COLUMNS,
+    SONGS_ORIGINAL,
+    SONGS_COVER,
+    JP_SERVER,
+    FRANCHISE_PARTICIPATION,
+    SEIYUU,
+    PLAY_STYLE,
+    OTHER_GAMES_IDOL,
+    OTHER_GAMES_RHYTHM,
+    "Is there anything else you would like to tell us?"
+]
+
+
+class SurveyGenerator:
+    """
+    Generates survey responses at any scale, deterministically for a given seed.
+
+    Every respondent belongs to a demographic segment (region, age and gender). Item popularity follows a
+    Zipf-like distribution, and each segment prefers its own random reordering of it, so answers are correlated
+    with demographics. Answers are also correlated with each other: favorite characters follow favorite bands,
+    and each band's favorite member follows favorite characters.
+    """
+
+    def __init__(
+            self,
+            seed=0,
+            skew=1.0,
+            correlation=0.5,
+            missing=0.02
+    ):
+        """
+        :param seed: Int; random seed
+        :param skew: Float; Zipf exponent of item popularity (0 is uniform, higher is more skewed)
+        :param correlation: Float from 0 to 1; how much each segment's preferences differ from overall popularity
+        :param missing: Float from 0 to 1; proportion of unanswered optional questions
+        """
+        if not 0 <= correlation <= 1:
+            raise ValueError("invalid 'correlation' argument: must be between 0 and 1")
+        if not 0 <= missing < 1:
+            raise ValueError("invalid 'missing' argument: must be at least 0 and less than 1")
+        self.seed = seed
+        self.skew = skew
+        self.correlation = correlation
+        self.missing = missing
+        self._n_segments = len(REGIONS) * len(AGES) * len(GENDERS)
+        self._preferences = dict()  # memoized per number of items
+
+    def write(
+            self,
+            path,
+            rows,
+            chunk_size=100000
+    ):
+        """
+        Writes responses to a TSV file, a chunk at a time, so memory use doesn't grow with rows.
+        :param path: String
+        :param rows: Int; number of responses
+        :param chunk_size: Int; responses generated at once
+        """
+        rng = np.random.default_rng(self.seed)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write("\t".join(HEADER) + "\n")
+            for start in range(0, rows, chunk_size):
+                columns = self._chunk(rng, start, min(chunk_size, rows - start))
+                f.writelines("\t".join(row) + "\n" for row in zip(*columns))
+
+    def _chunk(
+            self,
+            rng,
+            start,
+            n
+    ):
+        """
+        :return: List of Arrays of Strings; one per column of HEADER
+        """
+        region = self._choose(rng, n, REGION_WEIGHTS)
+        age = self._choose(rng, n, AGE_WEIGHTS)
+        gender = self._choose(rng, n, GENDER_WEIGHTS)
+        segment = (region * len(AGES) + age) * len(GENDERS) + gender
+
+        bands_music = self._pick(rng, segment, len(ALL_BANDS), 2)
+        bands_chara = self._pick(rng, segment, len(ALL_BANDS), 2)
+        band_liking = self._preference(len(ALL_BANDS))[segment] + bands_chara  # favorite bands have favorite girls
+        character_weights = np.full((n, len(ALL_CHARACTERS)), band_liking.min(axis=1, keepdims=True) / 2)
+        for band, members in enumerate(BAND_MEMBERS):
+            ids = [ALL_CHARACTERS.index(member) for member in members]
+            character_weights[:, ids] = band_liking[:, [band]]
+        characters = self._pick_weighted(rng, character_weights * self._preference(len(ALL_CHARACTERS))[segment], 5)
+
+        columns = [
+            np.array([f"{i}" for i in range(start, start + n)], dtype=object),
+            self._labels(GENDERS, gender),
+            self._labels(GENDERS, gender),
+            self._labels(AGES, age),
+            self._labels(AGES, age),
+            self._labels(REGIONS, region),
+            self._join(ALL_BANDS, bands_music),
+            self._join(ALL_BANDS, bands_chara),
+            self._join(ALL_CHARACTERS, characters),
+            self._join(ALL_CHARACTER_REASONS, self._pick(rng, segment, len(ALL_CHARACTER_REASONS), 3))
+        ]
+        for members in BAND_MEMBERS:  # a band's favorite member is most likely a favorite character
+            ids = [ALL_CHARACTERS.index(member) for member in members]
+            weights = character_weights[:, ids] * (1 + 4 * characters[:, ids])
+            columns.append(self._labels(members, self._choose_weighted(rng, weights)))
+        columns += [
+            self._join(SONGS_ORIGINAL_VALUES, self._pick(rng, segment, len(SONGS_ORIGINAL_VALUES), 7)),
+            self._join(SONGS_COVER_VALUES, self._pick(rng, segment, len(SONGS_COVER_VALUES), 7)),
+            self._labels(YES_NO, self._choose(rng, n, [3, 2])),
+            self._join(PARTICIPATION_VALUES, self._pick(rng, segment, len(PARTICIPATION_VALUES), 4)),
+            self._join(SEIYUU_VALUES, self._pick(rng, segment, len(SEIYUU_VALUES), 5)),
+            self._join(PLAY_STYLE_VALUES, self._pick(rng, segment, len(PLAY_STYLE_VALUES), 2)),
+            self._labels(YES_NO_USED_TO, self._choose(rng, n, [4, 4, 2])),
+            self._labels(YES_NO_USED_TO, self._choose(rng, n, [5, 3, 2])),
+            np.where(rng.random(n) < 0.1, "Thanks for the survey!", "").astype(object)
+        ]
+
+        for i in range(HEADER.index(BANDS_MUSIC), len(HEADER)):  # demographics are always answered
+            columns[i] = np.where(rng.random(n) < self.missing, "", columns[i])
+        return columns
+
+    def _preference(
+            self,
+            n_items
+    ):
+        """
+        :return: 2D Float array; per segment, relative preference for each of n_items items
+        """
+        if n_items not in self._preferences:
+            rng = np.random.default_rng([self.seed, n_items])
+            popularity = 1 / np.arange(1, n_items + 1) ** self.skew
+            segment_popularity = np.stack([rng.permutation(popularity) for _ in range(self._n_segments)])
+            weights = (1 - self.correlation) * popularity + self.correlation * segment_popularity
+            self._preferences[n_items] = weights / weights.sum(axis=1, keepdims=True)
+        return self._preferences[n_items]
+
+    def _pick(
+            self,
+            rng,
+            segment,
+            n_items,
+            max_picks
+    ):
+        """
+        :return: 2D Bool array; for each respondent, which of n_items they picked (1 to max_picks, by preference)
+        """
+        return self._pick_weighted(rng, self._preference(n_items)[segment], max_picks)
+
+    @staticmethod
+    def _pick_weighted(
+            rng,
+            weights,
+            max_picks
+    ):
+        """
+        Weighted sampling without replacement, for all respondents at once (Gumbel top-k).
+        :param weights: 2D Float array; one row per respondent
+        :return: 2D Bool array
+        """
+        n, n_items = weights.shape
+        keys = np.log(weights) + rng.gumbel(size=(n, n_items))
+        ranks = np.argsort(np.argsort(-keys, axis=1), axis=1)
+        return ranks < rng.integers(1, max_picks + 1, size=(n, 1))
+
+    @staticmethod
+    def _choose(
+            rng,
+            n,
+            weights
+    ):
+        """
+        :return: Int array; n weighted choices of an index of weights
+        """
+        weights = np.asarray(weights, dtype=float)
+        return rng.choice(len(weights), size=n, p=weights / weights.sum())
+
+    @staticmethod
+    def _choose_weighted(
+            rng,
+            weights
+    ):
+        """
+        :param weights: 2D Float array; one row per respondent
+        :return: Int array; one weighted choice per respondent
+        """
+        return np.argmax(np.log(weights) + rng.gumbel(size=weights.shape), axis=1)
+
+    @staticmethod
+    def _labels(
+            values,
+            ids
+    ):
+        return np.array(values, dtype=object)[ids]
+
+    @staticmethod
+    def _join(
+            values,
+            picked
+    ):
+        """
+        Writes multi-answer responses like the survey does: picked values, in the order they're listed in.
+        Each distinct combination is only joined once.
+        :param values: List of at most 64 Strings
+        :param picked: 2D Bool array; one row per respondent, one column per value
+        :return: Array of Strings
+        """
+        packed = np.packbits(picked, axis=1)  # each combination as one 64-bit key (at most 64 values)
+        keys = np.pad(packed, ((0, 0), (0, 8 - packed.shape[1]))).view(np.uint64).reshape(-1)
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        joined = [", ".join(v for v, p in zip(values, picked[i]) if p) for i in first]
+        return np.array(joined, dtype=object)[inverse.reshape(-1)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic survey responses.")
+    parser.add_argument("rows", type=int, help="number of responses")
+    parser.add_argument("path", help="TSV file to write")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of item popularity")
+    parser.add_argument("--correlation", type=float, default=0.5, help="0 to 1; how much answers follow demographics")
+    parser.add_argument("--missing", type=float, default=0.02, help="proportion of unanswered optional questions")
+    args = parser.parse_args(argv)
+
+    SurveyGenerator(args.seed, args.skew, args.correlation, args.missing).write(args.path, args.rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+Times the hot paths (loading, encoding, mining, searching and organizing rules, and counting for plots) on
+synthetic surveys of increasing size, and writes the results to a JSON file for comparing across versions.
+
+e.g. python -m benchmarks.suite                                   # 10k and 100k responses, every scenario
+     python -m benchmarks.suite --rows 10k 1m 10m --scenarios "mine_*" search --repeat 5
+     python -m benchmarks.suite --list
+"""
+
+import argparse
+import datetime
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import matplotlib
+import mlxtend
+import numpy as np
+import pandas as pd
+
+from constants import *
+from dataset import SurveyDataset
+from helpers import DataCleaner
+from miner import AssociationMiner
+from plotters import PandasPlotter
+from snsplotters import HeatMapPlotter
+from transactions import TransactionStore
+from benchmarks.generator import SurveyGenerator
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+FIGURE_DIR = os.path.join(tempfile.gettempdir(), "bandori-benchmark-figures")
+
+# Columns mined by the mining, search and organize scenarios
+COLUMNS = [CHARACTERS, CHARACTER_REASONS]
+COLUMN_VALUES = [ALL_CHARACTERS, ALL_CHARACTER_REASONS]
+
+
+class Scenario:
+    """
+    One timed operation. Setup isn't timed, and is run before every repetition, so caches can be cold.
+    """
+
+    def __init__(
+            self,
+            name,
+            run,
+            setup=None,
+            description=""
+    ):
+        """
+        :param name: String
+        :param run: Function taking the result of setup; the timed operation
+        :param setup: Function or None; takes the path of the TSV, returns what run needs (default: the path)
+        :param description: String
+        """
+        self.name = name
+        self.run = run
+        self.setup = setup or (lambda tsv_path: tsv_path)
+        self.description = description
+
+
+def _warm_cache(tsv_path):
+    DataCleaner.prepare_data_frame(tsv_path)
+    return tsv_path
+
+
+def _mined_rules(tsv_path):
+    rules = AssociationMiner(tsv_path).mine(COLUMNS, COLUMN_VALUES)
+    return rules.derive(rules.arrays)  # not yet indexed or organized
+
+
+SCENARIOS = [
+    Scenario(
+        "load",
+        lambda tsv_path: DataCleaner.prepare_data_frame(tsv_path, use_cache=False),
+        description="parse and clean the TSV"
+    ),
+    Scenario(
+        "load_cached",
+        DataCleaner.prepare_data_frame,
+        setup=_warm_cache,
+        description="load the cleaned DataFrame from the on-disk cache"
+    ),
+    Scenario(
+        "one_hot",
+        lambda df: TransactionStore(df).one_hot(COLUMNS, COLUMN_VALUES),
+        setup=lambda tsv_path: SurveyDataset(tsv_path).df,
+        description="encode favorite characters and reasons into transactions"
+    ),
+    Scenario(
+        "mine_characters",
+        lambda miner: miner.mine(COLUMNS, COLUMN_VALUES),
+        setup=AssociationMiner,
+        description="AssociationMiner.mine() over favorite characters and reasons"
+    ),
+    Scenario(
+        "mine_closed",
+        lambda miner: miner.mine(COLUMNS, COLUMN_VALUES, itemset_type="closed"),
+        setup=AssociationMiner,
+        description="AssociationMiner.mine() from closed itemsets only"
+    ),
+    Scenario(
+        "mine_region_characters",
+        lambda miner: miner.mine_region_favorite_characters(),
+        setup=AssociationMiner,
+        description="constrained mining of region -> favorite characters"
+    ),
+    Scenario(
+        "sweep",
+        lambda miner: miner.sweep(COLUMNS, COLUMN_VALUES, [0.005, 0.01, 0.02], ["confidence", "lift"],
+                                  {"confidence": [0.2, 0.3, 0.4], "lift": [1.0, 1.2]}),
+        setup=AssociationMiner,
+        description="AssociationMiner.sweep() over 3 supports x 5 metric thresholds"
+    ),
+    Scenario(
+        "top_k",
+        lambda miner: miner.mine(COLUMNS, COLUMN_VALUES, metric="lift", top_k=100),
+        setup=AssociationMiner,
+        description="AssociationMiner.mine() top 100 rules by lift, with no support threshold"
+    ),
+    Scenario(
+        "search",
+        lambda rules: rules.search(one_of=ALL_CHARACTER_REASONS),
+        setup=_mined_rules,
+        description="Rules.search() for reasons, including building the index"
+    ),
+    Scenario(
+        "organize",
+        lambda rules: rules.organize(max_antecedents=1, sort_by=["lift"], sort_ascending=[False]),
+        setup=_mined_rules,
+        description="Rules.organize()"
+    ),
+    Scenario(
+        "bootstrap",
+        lambda rules: rules.bootstrap(200, random_state=0, use_organized=False),
+        setup=_mined_rules,
+        description="Rules.bootstrap() intervals for every rule, 200 resamples"
+    ),
+    Scenario(
+        "permutation_test",
+        lambda rules: rules.permutation_test(20, random_state=0),
+        setup=_mined_rules,
+        description="Rules.permutation_test() p-values for every rule, 20 permutations"
+    ),
+    Scenario(
+        "group_counts",
+        lambda plotter: plotter._group_counts_for_answer(REGION, BANDS_MUSIC, ALL_BANDS),
+        setup=PandasPlotter,
+        description="PandasPlotter table of favorite bands by region, from a cold dataset"
+    ),
+    Scenario(
+        "heat_map",
+        lambda plotter: plotter.draw_age_vs_region(),
+        setup=lambda tsv_path: HeatMapPlotter(tsv_path, figure_dir=FIGURE_DIR),
+        description="HeatMapPlotter age vs region, rendered to PNG, from a cold dataset"
+    )
+]
+
+
+def parse_count(text):
+    """
+    :param text: String; e.g. "2500", "10k", or "1m"
+    :return: Int
+    """
+    multipliers = {"k": 10 ** 3, "m": 10 ** 6}
+    text = text.strip().lower()
+    if text and text[-1] in multipliers:
+        return int(float(text[:-1]) * multipliers[text[-1]])
+    return int(text)
+
+
+def select_scenarios(
+        patterns=None
+):
+    """
+    :param patterns: List of Strings or None (everything); scenario names or shell-style patterns
+    :return: List of Scenarios
+    :raises ValueError: if a pattern matches no scenario
+    """
+    selected = []
+    for pattern in patterns or ["*"]:
+        matches = [s for s in SCENARIOS if fnmatch.fnmatch(s.name, pattern)]
+        if not matches:
+            raise ValueError(f"no scenario matches '{pattern}'")
+        selected += [s for s in matches if s not in selected]
+    return selected
+
+
+def dataset_path(
+        data_dir,
+        rows,
+        generator
+):
+    """
+    Generates a synthetic survey, unless one with the same parameters was already generated.
+    :param data_dir: String; folder for generated TSVs
+    :param rows: Int
+    :param generator: SurveyGenerator
+    :return: String; path to TSV
+    """
+    name = f"responses-{rows}-s{generator.seed}-k{generator.skew:g}-c{generator.correlation:g}" \
+           f"-m{generator.missing:g}.tsv"
+    path = os.path.join(data_dir, name)
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        generator.write(tmp_path, rows)
+        os.replace(tmp_path, path)
+    return path
+
+
+def run_scenario(
+        scenario,
+        tsv_path,
+        repeat=3
+):
+    """
+    :param scenario: Scenario
+    :param tsv_path: String
+    :param repeat: Int; number of timed repetitions
+    :return: List of Floats; seconds taken by each repetition
+    """
+    times = []
+    for _ in range(repeat):
+        state = scenario.setup(tsv_path)
+        start = time.perf_counter()
+        scenario.run(state)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def environment():
+    """
+    :return: Dict; versions and machine the benchmarks ran with
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCHMARK_DIR,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "matplotlib": matplotlib.__version__,
+        "mlxtend": mlxtend.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark hot paths on synthetic surveys.")
+    parser.add_argument("--rows", nargs="+", default=["10k", "100k"], help="survey sizes, e.g. 10k 1m 10m")
+    parser.add_argument("--scenarios", nargs="+", default=None, help="scenario names or patterns (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed repetitions per scenario and size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of item popularity")
+    parser.add_argument("--correlation", type=float, default=0.5, help="0 to 1; how much answers follow demographics")
+    parser.add_argument("--missing", type=float, default=0.02, help="proportion of unanswered optional questions")
+    parser.add_argument("--data-dir", default=os.path.join(BENCHMARK_DIR, "data"), help="folder for generated TSVs")
+    parser.add_argument("--output", default=None, help="JSON file to write (default: benchmarks/results/<time>.json)")
+    parser.add_argument("--list", action="store_true", help="list scenarios and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for scenario in SCENARIOS:
+            print(f"{scenario.name:<25} {scenario.description}")
+        return 0
+
+    try:
+        scenarios = select_scenarios(args.scenarios)
+        sizes = [parse_count(rows) for rows in args.rows]
+        generator = SurveyGenerator(args.seed, args.skew, args.correlation, args.missing)
+    except ValueError as e:
+        parser.error(str(e))
+
+    results = []
+    for rows in sizes:
+        tsv_path = dataset_path(args.data_dir, rows, generator)
+        for scenario in scenarios:
+            times = run_scenario(scenario, tsv_path, args.repeat)
+            results.append({
+                "scenario": scenario.name,
+                "rows": rows,
+                "times": times,
+                "min": min(times),
+                "median": statistics.median(times)
+            })
+            print(f"{scenario.name:<25} {rows:>10}  min {min(times):9.4f}s  median {statistics.median(times):9.4f}s",
+                  flush=True)
+
+    report = {
+        "environment": environment(),
+        "generator": {k: getattr(generator, k) for k in ["seed", "skew", "correlation", "missing"]},
+        "repeat": args.repeat,
+        "results": results
+    }
+    output = args.output or os.path.join(
+        BENCHMARK_DIR, "results", datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Precomputed counts of respondents per demographic group, for heat maps and grouped bar plots.
+"""
+
+import numpy as np
+import pandas as pd
+
+from constants import *
+from helpers import DataCleaner
+
+# Demographic dimensions of CountCube, in axis order
+DIMENSIONS = [REGION, AGE, GENDER]
+
+
+class CountCube:
+    """
+    Number of respondents in every combination of region, age and gender, and (added lazily, one layer per
+    multi-response column) how many of them gave each answer.
+    Each dimension has one extra, last slot for invalid answers (see DataCleaner.valid_mask()), so that counts
+    filtered on some dimensions but not others can still be taken from the cube.
+
+    Every layer is built with a single bincount over integer codes. After that, any table of counts
+    (raw or normalized) is a slice of the cube, summed over the dimensions it doesn't show.
+    """
+
+    def __init__(
+            self,
+            df,
+            transactions
+    ):
+        """
+        :param df: DataFrame of responses; treated as read-only
+        :param transactions: TransactionStore over the same responses
+        """
+        self.df = df
+        self.transactions = transactions
+        self.labels = []  # per dimension, valid answers (sorted, like pd.crosstab())
+        self.orders = []  # per dimension, positions in labels, by first appearance in the responses
+
+        cells = np.zeros(len(df), dtype=np.int64)
+        for column in DIMENSIONS:
+            codes, labels = pd.factorize(df[column], sort=True)
+            valid = DataCleaner.valid_mask(df, column)
+            codes = np.where(valid & (codes >= 0), codes, len(labels))  # invalid answers go in the last slot
+            cells = cells * (len(labels) + 1) + codes
+            self.labels.append(list(labels))
+            self.orders.append(pd.unique(codes[codes < len(labels)]))
+
+        self.shape = tuple(len(labels) + 1 for labels in self.labels)
+        self._cells = cells
+        self.people = np.bincount(cells, minlength=int(np.prod(self.shape))).reshape(self.shape)
+        self._layers = dict()
+
+    def layer(
+            self,
+            column,
+            column_values
+    ):
+        """
+        :param column: name of a multi-response column
+        :param column_values: List of Strings; legal values of the column
+        :return: Int array; shape is self.shape + (len(column_values) + 1,), with the number of respondents in each
+            cell giving each value, and last, the number in each cell that responded at all; memoized
+        """
+        key = (column, tuple(column_values))
+        if key not in self._layers:
+            encoded = self.transactions.encode(column, column_values)
+            n_cells, n_values = int(np.prod(self.shape)), len(column_values) + 1
+            item_cells = self._cells[encoded.row_ids] * n_values + encoded.indices
+            responded_cells = self._cells[self.df[column].notna().to_numpy()] * n_values + n_values - 1
+            counts = np.bincount(np.concatenate([item_cells, responded_cells]), minlength=n_cells * n_values)
+            self._layers[key] = counts.reshape(self.shape + (n_values,))
+        return self._layers[key]
+
+    def crosstab(
+            self,
+            x,
+            y
+    ):
+        """
+        Same as pd.crosstab() of x and y, over responses valid in both.
+        :param x: one of DIMENSIONS; rows
+        :param y: another of DIMENSIONS; columns
+        :return: DataFrame of raw counts
+        """
+        x_axis, y_axis = DIMENSIONS.index(x), DIMENSIONS.index(y)
+        other_axes = tuple(axis for axis in range(len(DIMENSIONS)) if axis not in (x_axis, y_axis))
+        counts = self.people.sum(axis=other_axes)
+        if x_axis > y_axis:
+            counts = counts.T
+        counts = counts[:-1, :-1]  # drop invalid answers
+
+        rows, columns = counts.sum(axis=1) > 0, counts.sum(axis=0) > 0  # only answers someone gave
+        return pd.DataFrame(
+            counts[rows][:, columns],
+            index=pd.Index([label for label, r in zip(self.labels[x_axis], rows) if r], name=x),
+            columns=pd.Index([label for label, c in zip(self.labels[y_axis], columns) if c], name=y)
+        )
+
+    def group_counts(
+            self,
+            stat_col,
+            answer_col,
+            answer_values,
+            groups=None
+    ):
+        """
+        For each statistical group (e.g. people from Oceania) with a valid answer, the number of respondents that
+        gave each value of answer_col (e.g. favorite bands), and that number as a proportion of the respondents
+        in the group that answered answer_col at all.
+        Groups are in order of first appearance in the responses.
+
+        :param stat_col: one of DIMENSIONS
+        :param answer_col: name of a multi-response column
+        :param answer_values: List of Strings; all legal values for answer column
+        :param groups: List of Strings or None (all); groups of stat_col to keep
+        :return: two DataFrames (groups in rows, answer values in columns), one with raw counts and one with
+            proportions in group
+        """
+        axis = DIMENSIONS.index(stat_col)
+        other_axes = tuple(a for a in range(len(DIMENSIONS)) if a != axis)
+        sums = self.layer(answer_col, answer_values).sum(axis=other_axes)
+
+        labels = self.labels[axis]
+        order = [i for i in self.orders[axis] if groups is None or labels[i] in groups]
+        counts, responded = sums[order, :-1], sums[order, -1:]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            proportions = np.where(responded > 0, counts / responded, 0.0)  # groups where nobody responded get 0
+
+        index = [labels[i] for i in order]
+        non_normalized = pd.DataFrame(counts, index=index, columns=answer_values)
+        normalized = pd.DataFrame(proportions, index=index, columns=answer_values)
+        return non_normalized, normalized
+
+    @staticmethod
+    def normalize(
+            counts,
+            normalize
+    ):
+        """
+        Normalizes a table of counts the same way pd.crosstab() does.
+        :param counts: DataFrame of raw counts
+        :param normalize: "index" (rows sum to 1), "columns" (columns sum to 1), True (everything sums to 1),
+            or False (unchanged)
+        :return: DataFrame
+        """
+        if normalize is False:
+            return counts
+        elif normalize is True:
+            return counts / counts.to_numpy().sum()
+        elif normalize == "index":
+            return counts.div(counts.sum(axis=1), axis=0)
+        elif normalize == "columns":
+            return counts / counts.sum(axis=0)
+        else:
+            raise ValueError("invalid 'normalize' argument")
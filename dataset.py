@@ -0,0 +1,180 @@
+"""
+Shared, in-memory access to the survey responses.
+"""
+
+import os
+
+from constants import *
+from counts import CountCube
+from helpers import DataCleaner
+from transactions import TransactionStore
+
+
+class SurveyDataset:
+    """
+    Loads and cleans survey responses once, so that plotters and miners can share them instead of
+    each holding their own copy. Pass one to PandasPlotter, HeatMapPlotter or AssociationMiner in place
+    of a TSV path.
+
+    DataFrames handed out are shallow copies of the shared data: they're cheap to make, but they must be
+    treated as read-only (copy columns before modifying them).
+    Derived artifacts (filtered DataFrames, parsed multi-answer columns, etc.) are memoized.
+    """
+
+    def __init__(
+            self,
+            tsv_path,
+            use_cache=True
+    ):
+        """
+        :param tsv_path: String; path to survey responses (kept absolute, so it still works after a chdir)
+        :param use_cache: Bool; whether to use DataCleaner's on-disk cache
+        """
+        self.tsv_path = os.path.abspath(tsv_path)
+        self._df = DataCleaner.prepare_data_frame(tsv_path, use_cache=use_cache)
+        self._memo = dict()
+
+    @classmethod
+    def load(
+            cls,
+            data
+    ):
+        """
+        :param data: String (path to TSV) or SurveyDataset
+        :return: SurveyDataset; data itself if already loaded
+        """
+        return data if isinstance(data, cls) else cls(data)
+
+    @property
+    def df(self):
+        """
+        :return: DataFrame; read-only view of all cleaned responses
+        """
+        return self._df.copy(deep=False)
+
+    @property
+    def transactions(self):
+        """
+        :return: TransactionStore; shared encoding of multi-response answers for mining
+        """
+        return self.memoize("transactions", lambda: TransactionStore(self._df))
+
+    @property
+    def counts(self):
+        """
+        :return: CountCube; shared demographic counts for heat maps and grouped bar plots
+        """
+        return self.memoize("counts", lambda: CountCube(self._df, self.transactions))
+
+    @property
+    def fingerprint(self):
+        """
+        :return: String; hash of everything the cleaned responses depend on (see DataCleaner.cache_key())
+        """
+        return self.memoize("fingerprint", lambda: DataCleaner.cache_key(self.tsv_path))
+
+    def memoize(
+            self,
+            key,
+            factory
+    ):
+        """
+        General method to compute something from the responses at most once.
+        :param key: hashable; identifies the artifact
+        :param factory: Function with no arguments that makes the artifact
+        :return: the artifact
+        """
+        if key not in self._memo:
+            self._memo[key] = factory()
+        return self._memo[key]
+
+    def filtered(
+            self,
+            *columns,
+            keep_all_legal=True
+    ):
+        """
+        Responses with invalid answers (see DataCleaner.filter_invalids()) removed from every column given.
+        E.g. filtered(GENDER, REGION) is the same as filter_region(filter_gender(df)).
+
+        :param columns: column names to filter on
+        :param keep_all_legal: Bool; whether to keep regions with low sample sizes, if REGION is filtered on
+        :return: DataFrame; read-only view
+        """
+        def factory():
+            df = self._df
+            for column in columns:
+                if column == REGION:
+                    df = DataCleaner.filter_region(df, keep_all_legal=keep_all_legal)
+                else:
+                    df = DataCleaner.filter_invalids(df, column)
+            return df
+
+        key = ("filtered", frozenset(columns), keep_all_legal if REGION in columns else None)
+        return self.memoize(key, factory).copy(deep=False)
+
+    def unique_answers(
+            self,
+            column,
+            *filter_columns,
+            keep_all_legal=True
+    ):
+        """
+        See ResponseParser.unique_answers(). The column is only parsed once, however many times this is called.
+        :param column: column name to parse
+        :param filter_columns: column names to remove invalid answers from before parsing (see filtered())
+        :param keep_all_legal: Bool; whether to keep regions with low sample sizes, if REGION is filtered on
+        :return: List; a fresh copy, so it's safe to modify
+        """
+        def factory():
+            rows = None
+            if filter_columns:
+                rows = self._df.index.isin(self.filtered(*filter_columns, keep_all_legal=keep_all_legal).index)
+            return self.transactions.tokens(column).items_given(rows)
+
+        region_arg = keep_all_legal if REGION in filter_columns else None
+        return list(self.memoize(("unique_answers", column, frozenset(filter_columns), region_arg), factory))
+
+
+class OneHotTransactions:
+    """
+    Transactions for mining, as what to encode rather than the encoded table (see TransactionStore.one_hot()):
+    a Function with no arguments returning the one-hot table, which is only built when first called.
+
+    Pickles as the TSV path and the columns, never as the table, so e.g. cached Rules stay small; once unpickled,
+    the dataset is loaded again when the table is first needed.
+    """
+
+    def __init__(
+            self,
+            dataset,
+            columns,
+            column_values,
+            sparse=False
+    ):
+        """
+        :param dataset: SurveyDataset or String (path to TSV)
+        :param columns: List of column names
+        :param column_values: List; each element is itself a list, holding the legal values of the column
+        :param sparse: Bool; whether to build a sparse table
+        """
+        self.dataset = dataset
+        self.columns = columns
+        self.column_values = column_values
+        self.sparse = sparse
+        self._table = None
+
+    def __call__(self):
+        """
+        :return: DataFrame; one-hot encoded transactions (memoized)
+        """
+        if self._table is None:
+            self.dataset = SurveyDataset.load(self.dataset)
+            self._table = self.dataset.transactions.one_hot(self.columns, self.column_values, sparse=self.sparse)
+        return self._table
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["dataset"] = os.path.abspath(getattr(self.dataset, "tsv_path", self.dataset))  # unpickled anywhere
+        state["_table"] = None
+        return state
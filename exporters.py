@@ -0,0 +1,229 @@
+"""
+Writers for exporting tables (e.g. mined rules), and an Exporter that runs them in the background.
+"""
+
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import stage
+
+
+class CsvWriter:
+    """
+    Plain CSV, as written by DataFrame.to_csv(). Itemsets are written as their string representations,
+    e.g. "frozenset({'Imai Lisa'})".
+    """
+
+    extension = "csv"
+
+    @staticmethod
+    def write(
+            df,
+            path
+    ):
+        """
+        :param df: DataFrame
+        :param path: String; file to write
+        """
+        df.to_csv(path)
+
+
+class NpzWriter:
+    """
+    Columnar binary format (NumPy .npz archive), with one array per column and no string conversion of itemsets.
+    Itemset columns (e.g. antecedents and consequents) are stored in compressed sparse row form, as ids into a
+    shared, sorted list of items: the items of row i are items[ids[offsets[i]:offsets[i + 1]]].
+
+    Arrays in the archive:
+        "columns", "index": names of columns, and the index
+        "items": every item in any itemset column
+        "<column>": values of a column that isn't an itemset column
+        "<column>.ids", "<column>.offsets": an itemset column
+    """
+
+    extension = "npz"
+
+    @classmethod
+    def write(
+            cls,
+            df,
+            path
+    ):
+        """
+        :param df: DataFrame
+        :param path: String; file to write
+        """
+        itemset_columns = [c for c in df.columns if cls._is_itemset_column(df[c])]
+        items = sorted({item for c in itemset_columns for itemset in df[c] for item in itemset})
+        item_ids = {item: i for i, item in enumerate(items)}
+
+        arrays = {
+            "columns": np.array([str(c) for c in df.columns]),
+            "index": df.index.to_numpy(),
+            "items": np.array(items, dtype=str)
+        }
+        for c in df.columns:
+            if c in itemset_columns:
+                itemsets = [sorted(item_ids[item] for item in itemset) for itemset in df[c]]
+                offsets = np.zeros(len(itemsets) + 1, dtype=np.int64)
+                np.cumsum([len(ids) for ids in itemsets], out=offsets[1:])
+                arrays[f"{c}.ids"] = np.fromiter(itertools.chain.from_iterable(itemsets), dtype=np.int32,
+                                                 count=offsets[-1])
+                arrays[f"{c}.offsets"] = offsets
+            elif df[c].dtype == object:
+                arrays[str(c)] = df[c].to_numpy(dtype=str)
+            else:
+                arrays[str(c)] = df[c].to_numpy()
+
+        with open(path, "wb") as f:  # a file object, so np.savez doesn't append its own extension
+            np.savez(f, **arrays)
+
+    @staticmethod
+    def read(
+            path
+    ):
+        """
+        Loads a table written by write().
+        :param path: String
+        :return: DataFrame; itemset columns as frozensets again
+        """
+        with np.load(path) as archive:
+            items = archive["items"].astype(object)
+            data = dict()
+            for c in archive["columns"]:
+                if f"{c}.ids" in archive:
+                    ids, offsets = archive[f"{c}.ids"], archive[f"{c}.offsets"]
+                    data[c] = [frozenset(items[ids[start:end]]) for start, end in zip(offsets[:-1], offsets[1:])]
+                else:
+                    data[c] = archive[c]
+            return pd.DataFrame(data, index=archive["index"], columns=list(archive["columns"]))
+
+    @staticmethod
+    def _is_itemset_column(
+            series
+    ):
+        return series.dtype == object and len(series) > 0 and isinstance(series.iloc[0], frozenset)
+
+
+# Writers by format name
+WRITERS = {
+    "csv": CsvWriter,
+    "npz": NpzWriter
+}
+
+
+class Exporter:
+    """
+    Writes tables to files in one or more formats (see WRITERS), on a background thread so that the caller
+    doesn't wait for the disk. Tables are written in the order they were exported.
+    Exported DataFrames must not be modified afterwards, as they may not have been written yet.
+
+    Call flush() to wait until everything exported so far is written (e.g. before reading the files or the
+    instrumentation of the writes, or before exiting); it also raises the first error from any write.
+    """
+
+    def __init__(
+            self,
+            output_dir=None,
+            formats=("csv",),
+            background=True
+    ):
+        """
+        :param output_dir: String or None; folder to write into, created if needed (default: working directory,
+            at the time each table is exported)
+        :param formats: List of format names (keys of WRITERS) or writers (any object with an extension attribute
+            and a write(df, path) method)
+        :param background: Bool; whether to write on a background thread, or before export() returns
+        """
+        self.output_dir = output_dir
+        self.writers = []
+        for fmt in formats:
+            if isinstance(fmt, str):
+                if fmt not in WRITERS:
+                    raise ValueError(f"invalid format argument: must be one of {list(WRITERS)}, or a writer")
+                fmt = WRITERS[fmt]
+            self.writers.append(fmt)
+        self.background = background
+        self._executor = None
+        self._pending = []
+
+    def export(
+            self,
+            df,
+            name,
+            instrumentation=None
+    ):
+        """
+        Writes df once per format, to <output_dir>/<name>.<extension>.
+        :param df: DataFrame
+        :param name: String; file name without extension
+        :param instrumentation: Instrumentation or None; if given, the write is reported to it as an "export"
+            stage once it's done (background writes are timed on the background thread, without their memory)
+        :return: List of Strings; paths that are (or will be) written
+        """
+        output_dir = os.path.abspath(self.output_dir or os.getcwd())
+        paths = [os.path.join(output_dir, f"{name}.{writer.extension}") for writer in self.writers]
+        if not self.background:
+            with stage(instrumentation, "export", file=name, rules=len(df)):
+                self._write(df, output_dir, paths)
+            return paths
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="exporter")
+        label = instrumentation.current_label() if instrumentation is not None else None
+        self._pending.append(self._executor.submit(self._timed_write, df, output_dir, paths, instrumentation,
+                                                   label, name))
+        return paths
+
+    def flush(self):
+        """
+        Waits until every table exported so far is written.
+        :raises Exception: the first error raised by a write, if any
+        """
+        pending, self._pending = self._pending, []
+        errors = [f.exception() for f in pending]  # waits for each
+        errors = [e for e in errors if e is not None]
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        """
+        Flushes, then stops the background thread. Exporting again starts a new one.
+        """
+        try:
+            self.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _timed_write(
+            self,
+            df,
+            output_dir,
+            paths,
+            instrumentation,
+            label,
+            name
+    ):
+        start = time.perf_counter()
+        try:
+            self._write(df, output_dir, paths)
+        finally:
+            if instrumentation is not None:
+                instrumentation.record("export", time.perf_counter() - start, label, file=name, rules=len(df))
+
+    def _write(
+            self,
+            df,
+            output_dir,
+            paths
+    ):
+        os.makedirs(output_dir, exist_ok=True)
+        for writer, path in zip(self.writers, paths):
+            writer.write(df, path)
@@ -1,7 +1,71 @@
+import glob
+import hashlib
+import os
+import re
+
+import numpy as np
 import pandas as pd
 
 from constants import *
 
+# Columns kept by DataCleaner.prepare_data_frame(); everything else in the survey is dropped
+COLUMNS = [
+    REGION,
+    GENDER,
+    AGE,
+    BANDS_MUSIC,
+    BANDS_CHARA,
+    CHARACTERS,
+    CHARACTER_REASONS,
+    CHARACTER_POPIPA,
+    CHARACTER_AFTERGLOW,
+    CHARACTER_GURIGURI,
+    CHARACTER_HHW,
+    CHARACTER_PASUPARE,
+    CHARACTER_RAS,
+    CHARACTER_ROSELIA,
+    SONGS_ORIGINAL,
+    SONGS_COVER,
+    JP_SERVER,
+    FRANCHISE_PARTICIPATION,
+    SEIYUU,
+    PLAY_STYLE,
+    OTHER_GAMES_IDOL,
+    OTHER_GAMES_RHYTHM
+]
+
+# Single-answer columns, stored as categoricals: each distinct answer is kept once, and rows only hold integer codes
+CATEGORICAL_COLUMNS = [
+    REGION,
+    GENDER,
+    AGE,
+    CHARACTER_POPIPA,
+    CHARACTER_AFTERGLOW,
+    CHARACTER_GURIGURI,
+    CHARACTER_HHW,
+    CHARACTER_PASUPARE,
+    CHARACTER_RAS,
+    CHARACTER_ROSELIA,
+    JP_SERVER,
+    OTHER_GAMES_IDOL,
+    OTHER_GAMES_RHYTHM
+]
+
+# Regions with large sample sizes
+CORE_REGIONS = ["North America", "Southeast Asia", "Europe", "South America", "Oceania"]
+
+# Answers renamed when loading
+RENAMED_ANSWERS = {
+    "North Asia and Central Asia": "North/Central Asia"  # makes plotting nicer
+}
+
+# Round brackets and their contents, which aren't part of an answer's name
+PARENTHESES = re.compile(r"\([^()]*\)")
+
+# Bump whenever cleaning code changes in a way that makes previously cached DataFrames wrong (changes to the
+# constants above are picked up by DataCleaner.cache_key() already)
+CACHE_VERSION = 2
+
 
 class ResponseParser:
     """
@@ -15,18 +79,87 @@ class ResponseParser:
         Main use case is to break up multi-answer responses into individual answers,
         but this method works on single-answer responses as well (it just does unnecessary work).
         Substrings assumed to be individual answers if comma-separated (after removing round brackets and their
-        contents).
+        contents). Doesn't modify df.
 
         e.g. if response is "Europe (includes Russia), North America [NA] (includes Mexico, Central America,
                 Caribbean)", then "Europe" and "North America [NA]" are the two individual answers of the response,
-                and will be included in the returned array.
+                and will be included in the returned list.
+
+        :return: List of Strings; in order of first appearance
+        """
+        return ResponseParser.tokenize(df[column])[0]
 
-        :return: Array
+    @staticmethod
+    def tokenize(series):
+        """
+        Splits every response into individual answers (see unique_answers()), in compressed sparse row (CSR) form:
+        the answers of response i are answers[ids[offsets[i]:offsets[i + 1]]].
+        Each distinct response is only parsed once, and series isn't modified.
+        Missing responses and empty answers (e.g. a response that was only brackets) have no answers.
+
+        :param series: Series of responses
+        :return: Tuple of (List of Strings; all answers, in order of first appearance,
+            Int array; offsets of each response into ids, with one more element than there are responses,
+            Int array; ids of the answers of all responses, one response after another)
         """
-        # remove round brackets' contents (https://stackoverflow.com/a/40621332)
-        df[column].replace(r"\([^()]*\)", "", regex=True, inplace=True)
-        answers = df[column].str.split(",", expand=True)  # split up answers
-        return answers.stack().str.strip().unique().tolist()  # make into Series, clean, and get all unique
+        codes, responses = pd.factorize(series)
+        answer_ids = dict()
+        response_ids = []
+        for response in responses:
+            answers = (answer.strip() for answer in PARENTHESES.sub("", str(response)).split(","))
+            response_ids.append([answer_ids.setdefault(a, len(answer_ids)) for a in answers if a])
+
+        # Expand answers of distinct responses out to every response
+        lengths = np.array([len(ids) for ids in response_ids] + [0], dtype=np.int64)  # last is for missing responses
+        starts = np.concatenate([[0], np.cumsum(lengths)])
+        flat_ids = np.array([i for ids in response_ids for i in ids], dtype=np.int32)
+        row_lengths = lengths[codes]  # code -1 (missing) picks the last length
+        offsets = np.zeros(len(codes) + 1, dtype=np.int64)
+        np.cumsum(row_lengths, out=offsets[1:])
+        positions = np.repeat(starts[codes] - offsets[:-1], row_lengths) + np.arange(offsets[-1])
+        return list(answer_ids), offsets, flat_ids[positions]
+
+    @staticmethod
+    def answer_pattern(
+            answer_values
+    ):
+        """
+        Compiles all legal values into one regular expression, which finds every value in a response in a single
+        pass. A value only matches as a whole answer: at the start of the response or after a comma, and followed
+        by a comma, a round bracket (e.g. "Europe (includes Russia)") or the end of the response.
+        Longer values are tried first, so a value that contains another (e.g. "Hello, Happy World!" and "Hello")
+        matches as itself.
+
+        :param answer_values: List of Strings; all legal values
+        :return: compiled regular expression; findall() gives the values in a response, in order
+        """
+        alternatives = "|".join(re.escape(value) for value in sorted(answer_values, key=len, reverse=True))
+        return re.compile(r"(?:^|,)\s*(" + alternatives + r")(?=\s*(?:[,(]|$))")
+
+    @staticmethod
+    def answer_indicators(
+            series,
+            answer_values
+    ):
+        """
+        Finds which of answer_values each response contains (see answer_pattern()). Missing responses contain
+        nothing.
+
+        Each distinct response is only checked once, which matters because most people pick from the same few
+        combinations of answers.
+
+        :param series: Series of responses
+        :param answer_values: List of Strings; all legal values
+        :return: 2D Bool array; one row per response, one column per value (in order of answer_values)
+        """
+        codes, responses = pd.factorize(series)
+        found = np.zeros((len(responses) + 1, len(answer_values)), dtype=bool)  # last row is for missing responses
+        if len(answer_values):
+            pattern = ResponseParser.answer_pattern(answer_values)
+            value_ids = {value: i for i, value in enumerate(answer_values)}
+            for row, response in enumerate(responses):
+                found[row, [value_ids[value] for value in pattern.findall(str(response))]] = True
+        return found[codes]  # code -1 (missing) picks the last row
 
 
 class DataCleaner:
@@ -34,50 +167,140 @@ class DataCleaner:
     Cleans DataFrames of unneeded data, invalid responses, etc.
     """
 
-    @staticmethod
+    @classmethod
     def prepare_data_frame(
+            cls,
+            tsv_path,
+            use_cache=True,
+            cache_dir=None
+    ):
+        """
+        Loads responses and strips them down to the columns in COLUMNS.
+        The cleaned DataFrame is cached on disk, keyed by the contents of the TSV and by the constants cleaning
+        depends on (see cache_key()), so loading the same survey again skips parsing. The cache is rebuilt
+        automatically if any of them changes.
+
+        :param tsv_path: String; path to the survey responses
+        :param use_cache: Bool; whether to read from and write to the on-disk cache
+        :param cache_dir: String or None; where cache files go, defaults to a ".cache" folder next to the TSV
+        :return: DataFrame
+        """
+        if not use_cache:
+            return cls._read_responses(tsv_path)
+
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(tsv_path)), ".cache")
+        stem = os.path.splitext(os.path.basename(tsv_path))[0]
+        cache_path = os.path.join(cache_dir, f"{stem}.{cls.cache_key(tsv_path)[:16]}.pkl")
+
+        if os.path.exists(cache_path):
+            try:
+                return pd.read_pickle(cache_path)
+            except Exception:
+                pass  # unreadable (e.g. interrupted write or pandas upgrade), so rebuild it
+
+        df = cls._read_responses(tsv_path)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            for stale in glob.glob(os.path.join(cache_dir, glob.escape(stem) + ".*.pkl")):
+                os.remove(stale)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            df.to_pickle(tmp_path)
+            os.replace(tmp_path, cache_path)  # atomic, so concurrent loaders never see half a file
+        except OSError:
+            pass  # caching is best-effort; e.g. read-only data folders still load fine
+        return df
+
+    @staticmethod
+    def _read_responses(
             tsv_path
     ):
-        df = pd.read_table(tsv_path)[
-            [REGION,
-             GENDER,
-             AGE,
-             BANDS_MUSIC,
-             BANDS_CHARA,
-             CHARACTERS,
-             CHARACTER_REASONS,
-             CHARACTER_POPIPA,
-             CHARACTER_AFTERGLOW,
-             CHARACTER_GURIGURI,
-             CHARACTER_HHW,
-             CHARACTER_PASUPARE,
-             CHARACTER_RAS,
-             CHARACTER_ROSELIA,
-             SONGS_ORIGINAL,
-             SONGS_COVER,
-             JP_SERVER,
-             FRANCHISE_PARTICIPATION,
-             SEIYUU,
-             PLAY_STYLE,
-             OTHER_GAMES_IDOL,
-             OTHER_GAMES_RHYTHM]
-        ]  # Filter out unneeded data
-
-        df = df.replace(to_replace="North Asia and Central Asia", value="North/Central Asia")  # makes plotting nicer
+        """
+        Only parses the columns in COLUMNS, and parses those in CATEGORICAL_COLUMNS straight into categoricals.
+        """
+        df = pd.read_table(
+            tsv_path,
+            usecols=COLUMNS,  # Filter out unneeded data while parsing
+            dtype={column: "category" for column in CATEGORICAL_COLUMNS}
+        )[COLUMNS]
+        for column in CATEGORICAL_COLUMNS:
+            categories = [RENAMED_ANSWERS.get(c, c) for c in df[column].cat.categories]
+            df[column] = df[column].cat.rename_categories(categories).cat.reorder_categories(sorted(categories))
         return df
 
     @staticmethod
+    def file_hash(
+            path
+    ):
+        """
+        :param path: String; path to file
+        :return: String; SHA-256 hex digest of file contents
+        """
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    @classmethod
+    def cache_key(
+            cls,
+            tsv_path
+    ):
+        """
+        :param tsv_path: String; path to the survey responses
+        :return: String; hash of everything the cleaned DataFrame (and so anything mined or counted from it)
+            depends on: the file, CACHE_VERSION, COLUMNS, CATEGORICAL_COLUMNS, RENAMED_ANSWERS, CORE_REGIONS
+            and PARENTHESES
+        """
+        sha = hashlib.sha256()
+        sha.update(cls.file_hash(tsv_path).encode())
+        sha.update(repr((
+            CACHE_VERSION, COLUMNS, CATEGORICAL_COLUMNS, RENAMED_ANSWERS, CORE_REGIONS, PARENTHESES.pattern
+        )).encode())
+        return sha.hexdigest()
+
+    @staticmethod
+    def valid_mask(
+            df,
+            column
+    ):
+        """
+        :param df: DataFrame
+        :param column: name of column to check
+        :return: Bool array; whether each row has a valid (answered, not NO_RESPONSE) value in column
+        """
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):  # compare codes instead of strings
+            codes = values.cat.codes.to_numpy()
+            no_response = values.cat.categories.get_indexer([NO_RESPONSE])[0]  # -1 (i.e. missing) if nobody said it
+            return (codes >= 0) & (codes != no_response)
+        return ((values != NO_RESPONSE) & values.notna()).to_numpy(dtype=bool)
+
+    @classmethod
     def filter_invalids(
+            cls,
             df,
             column
     ):
         """
         General method for removing rows with invalid values in a column.
+        Categories no longer used by any remaining row are dropped, so they don't show up in counts.
         :param df: DataFrame
         :param column: name of column to check
         """
-        res = df[df[column] != NO_RESPONSE]
-        return res.dropna(subset=[column])  # remove if NaN
+        return cls.remove_unused_categories(df[cls.valid_mask(df, column)])
+
+    @staticmethod
+    def remove_unused_categories(
+            df
+    ):
+        """
+        :param df: DataFrame
+        :return: DataFrame; df with unused categories removed from its categorical columns
+        """
+        categorical = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+        return df.assign(**{c: df[c].cat.remove_unused_categories() for c in categorical})
 
     @classmethod
     def filter_gender(
@@ -104,6 +327,5 @@ class DataCleaner:
         :param keep_all_legal: Whether to keep regions with low sample sizes or not
         """
         if not keep_all_legal:
-            keep_list = ["North America", "Southeast Asia", "Europe", "South America", "Oceania"]
-            df = df[df[REGION].isin(keep_list)]
+            df = df[df[REGION].isin(CORE_REGIONS)]
         return cls.filter_invalids(df, REGION)
@@ -0,0 +1,232 @@
+"""
+Opt-in timing and memory measurement of pipeline stages, reported to pluggable sinks.
+"""
+
+import contextlib
+import json
+import logging
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+
+class StageRecord:
+    """
+    Measurements of one finished stage.
+    """
+
+    def __init__(
+            self,
+            stage,
+            elapsed,
+            peak_memory=None,
+            label=None,
+            info=None
+    ):
+        """
+        :param stage: String; name of stage, e.g. "find_sets"
+        :param elapsed: Float; wall time in seconds
+        :param peak_memory: Int or None; peak bytes allocated during the stage, above what was allocated before it
+            (None if memory wasn't tracked)
+        :param label: String or None; what the stage was part of, e.g. "mine_favorite_characters"
+        :param info: Dict or None; counts and other details, e.g. {"itemsets": 120}
+        """
+        self.stage = stage
+        self.elapsed = elapsed
+        self.peak_memory = peak_memory
+        self.label = label
+        self.info = info or dict()
+
+    def as_dict(self):
+        """
+        :return: Dict; flat, and JSON serializable as long as info is
+        """
+        return {"stage": self.stage, "label": self.label, "elapsed": self.elapsed,
+                "peak_memory": self.peak_memory, **self.info}
+
+
+class Instrumentation:
+    """
+    Measures stages of work, and reports a StageRecord for each to every sink as soon as it finishes.
+    Sinks are any functions taking a StageRecord (e.g. print, LogSink, JsonLinesSink). Records are also kept.
+
+    Peak memory is measured with tracemalloc, which slows down allocation-heavy code while tracing;
+    use track_memory=False for timings only. Stages aren't meant to be nested. Work done on other threads
+    (e.g. background exports) is timed there and reported with record(), without its memory.
+    """
+
+    def __init__(
+            self,
+            sinks=None,
+            track_memory=True
+    ):
+        """
+        :param sinks: List of Functions or None
+        :param track_memory: Bool; whether to measure peak memory of stages
+        """
+        self.sinks = list(sinks or [])
+        self.track_memory = track_memory
+        self.records = []
+        self._labels = []
+        self._lock = threading.Lock()  # records may be reported from other threads
+
+    @contextlib.contextmanager
+    def stage(
+            self,
+            name,
+            **info
+    ):
+        """
+        Context manager measuring the code inside it. Yields a Dict, to which counts (e.g. number of itemsets)
+        can be added before the stage ends.
+        :param name: String; name of stage
+        :param info: initial contents of the yielded Dict
+        """
+        started_tracing = False
+        if self.track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            elif hasattr(tracemalloc, "reset_peak"):  # Python 3.9+; otherwise peak may be from before the stage
+                tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            elapsed = time.perf_counter() - start
+            peak_memory = None
+            if self.track_memory:
+                peak_memory = max(tracemalloc.get_traced_memory()[1] - baseline, 0)
+                if started_tracing:
+                    tracemalloc.stop()
+            self._report(StageRecord(name, elapsed, peak_memory, self.current_label(), info))
+
+    def record(
+            self,
+            name,
+            elapsed,
+            label=None,
+            **info
+    ):
+        """
+        Reports a stage timed elsewhere, e.g. on a background thread, where stage() can't be used.
+        :param name: String; name of stage
+        :param elapsed: Float; wall time in seconds
+        :param label: String or None; see current_label(), as it was when the work was started
+        :param info: counts and other details
+        """
+        self._report(StageRecord(name, elapsed, label=label, info=info))
+
+    def current_label(self):
+        """
+        :return: String or None; name of the innermost label() being measured in
+        """
+        return self._labels[-1] if self._labels else None
+
+    @contextlib.contextmanager
+    def label(
+            self,
+            name
+    ):
+        """
+        Context manager that labels stages inside it, e.g. with the ready-made method they're part of.
+        :param name: String
+        """
+        self._labels.append(name)
+        try:
+            yield
+        finally:
+            self._labels.pop()
+
+    def summary(self):
+        """
+        :return: DataFrame; one row per record, in order of completion
+        """
+        return pd.DataFrame([record.as_dict() for record in self.records])
+
+    def _report(
+            self,
+            record
+    ):
+        with self._lock:
+            self.records.append(record)
+            for sink in self.sinks:
+                sink(record)
+
+
+class LogSink:
+    """
+    Logs each StageRecord as a JSON object, so logs can be parsed.
+    """
+
+    def __init__(
+            self,
+            logger=None,
+            level=logging.INFO
+    ):
+        """
+        :param logger: Logger or None; defaults to the "instrumentation" logger
+        :param level: Int; logging level
+        """
+        self.logger = logger or logging.getLogger("instrumentation")
+        self.level = level
+
+    def __call__(self, record):
+        self.logger.log(self.level, json.dumps(record.as_dict()))
+
+
+class JsonLinesSink:
+    """
+    Appends each StageRecord to a file as one line of JSON. Each line is written with a single call, so
+    several processes can share a file.
+    """
+
+    def __init__(
+            self,
+            path
+    ):
+        """
+        :param path: String
+        """
+        self.path = path
+
+    def __call__(self, record):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record.as_dict()) + "\n")
+
+
+@contextlib.contextmanager
+def stage(
+        instrumentation,
+        name,
+        **info
+):
+    """
+    Instrumentation.stage(), or a stage that measures nothing if instrumentation is None.
+    :param instrumentation: Instrumentation or None
+    """
+    if instrumentation is None:
+        yield info
+    else:
+        with instrumentation.stage(name, **info) as stage_info:
+            yield stage_info
+
+
+@contextlib.contextmanager
+def label(
+        instrumentation,
+        name
+):
+    """
+    Instrumentation.label(), or nothing if instrumentation is None.
+    :param instrumentation: Instrumentation or None
+    """
+    if instrumentation is None:
+        yield
+    else:
+        with instrumentation.label(name):
+            yield
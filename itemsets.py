@@ -0,0 +1,509 @@
+"""
+Native frequent itemset mining on packed bitsets, as an alternative to mlxtend's apriori and fpgrowth, and rule
+generation from itemsets.
+"""
+
+import heapq
+import itertools
+
+import numpy as np
+import pandas as pd
+
+# Number of set bits in each possible byte, for NumPy versions without bitwise_count()
+_BYTE_POPCOUNTS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(words):
+    """
+    Counts set bits along the last axis.
+    :param words: Array of uint64 words
+    :return: Int array with one dimension fewer than words
+    """
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    as_bytes = words.view(np.uint8).reshape(words.shape[:-1] + (-1,))
+    return _BYTE_POPCOUNTS[as_bytes].sum(axis=-1, dtype=np.int64)
+
+
+def pack_columns(one_hot_df):
+    """
+    Packs each column of a one-hot encoded DataFrame into a bitset of the rows that contain it (one bit per row).
+    Sparse DataFrames are packed straight from their stored cells, without making a dense table.
+    :param one_hot_df: DataFrame of Bools; dense or sparse
+    :return: 2D uint64 array; one row of words per column
+    """
+    if hasattr(one_hot_df, "sparse"):
+        matrix = one_hot_df.sparse.to_coo()
+        rows, columns = matrix.row[matrix.data != 0], matrix.col[matrix.data != 0]
+        packed = np.zeros((one_hot_df.shape[1], -(-len(one_hot_df) // 64) * 8), dtype=np.uint8)
+        bits = np.right_shift(0x80, rows & 7).astype(np.uint8)  # same bit order as np.packbits()
+        np.bitwise_or.at(packed, (columns, rows >> 3), bits)
+        return packed.view(np.uint64)
+
+    array = np.ascontiguousarray(one_hot_df.to_numpy(dtype=bool).T)
+    packed = np.packbits(array, axis=1)  # bytes
+    padding = -packed.shape[1] % 8  # whole words only
+    if padding:
+        packed = np.pad(packed, ((0, 0), (0, padding)))
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+
+def eclat(
+        df,
+        min_support=0.5,
+        use_colnames=False,
+        max_len=None
+):
+    """
+    Finds frequent itemsets with a depth-first, vertical (Eclat-style) search: every itemset is a bitset of the
+    rows containing it, extending an itemset is a bitwise AND, and support counting is a popcount.
+    All extensions of an itemset are intersected and counted at once, as one array operation.
+
+    Takes the same arguments as, and returns the same shape of table as, mlxtend's apriori().
+
+    :param df: DataFrame of Bools; one-hot encoded transactions
+    :param min_support: Float; threshold occurrence for a set to be considered "frequent"
+    :param use_colnames: Bool; whether itemsets hold column names (True) or column indexes (False)
+    :param max_len: Int or None; maximum length of itemsets
+    :return: DataFrame with "support" and "itemsets" (frozensets) columns
+    """
+    n_rows = len(df)
+    labels = list(df.columns) if use_colnames else list(range(df.shape[1]))
+    supports, itemsets = [], []
+
+    if n_rows == 0 or df.shape[1] == 0:
+        return pd.DataFrame({"support": supports, "itemsets": itemsets}, columns=["support", "itemsets"])
+
+    bits = pack_columns(df)
+    item_supports = popcount(bits) / n_rows
+    frequent = np.flatnonzero(item_supports >= min_support)
+
+    def extend(prefix, items, item_bits, item_support):
+        """
+        :param prefix: Tuple of item indexes
+        :param items: Int array; items that are frequent when added to prefix, in search order
+        :param item_bits: 2D uint64 array; parallel to items, bitsets of prefix + item
+        :param item_support: Float array; parallel to items, support of prefix + item
+        """
+        for i, item in enumerate(items):
+            itemset = prefix + (item,)
+            supports.append(item_support[i])
+            itemsets.append(frozenset(labels[j] for j in itemset))
+
+            if max_len is not None and len(itemset) >= max_len:
+                continue
+            joined = item_bits[i + 1:] & item_bits[i]  # intersect with all later extensions at once
+            joined_support = popcount(joined) / n_rows
+            keep = joined_support >= min_support
+            if keep.any():
+                extend(itemset, items[i + 1:][keep], joined[keep], joined_support[keep])
+
+    extend((), frequent, bits[frequent], item_supports[frequent])
+    return pd.DataFrame({"support": supports, "itemsets": itemsets}, columns=["support", "itemsets"])
+
+
+def lcm(
+        df,
+        min_support=0.5,
+        use_colnames=False,
+        maximal=False
+):
+    """
+    Finds closed frequent itemsets (those with no superset of the same support) with LCM's prefix-preserving
+    closure extension, on the same bitsets as eclat(). Every frequent itemset has the support of its closure
+    (its smallest closed superset), so closed itemsets hold the supports of all frequent itemsets, and there are
+    usually far fewer of them when answers are correlated. Each closed itemset is found exactly once, without
+    keeping those found so far: an extension of a closed itemset is only followed if taking its closure doesn't
+    add any item that comes before the new item.
+
+    Bitsets are narrowed to the words where the itemset occurs as the search goes deeper, so the cost of a step
+    shrinks with its support.
+
+    Takes the same arguments as, and returns the same shape of table as, mlxtend's apriori() (without max_len,
+    which closure doesn't respect).
+
+    :param df: DataFrame of Bools; one-hot encoded transactions
+    :param min_support: Float; threshold occurrence for a set to be considered "frequent"
+    :param use_colnames: Bool; whether itemsets hold column names (True) or column indexes (False)
+    :param maximal: Bool; whether to only return maximal frequent itemsets (those with no frequent superset),
+        which are closed, but lack the supports of their subsets
+    :return: DataFrame with "support" and "itemsets" (frozensets) columns
+    """
+    n_rows = len(df)
+    labels = list(df.columns) if use_colnames else list(range(df.shape[1]))
+    supports, itemsets = [], []
+
+    if n_rows == 0 or df.shape[1] == 0:
+        return pd.DataFrame({"support": supports, "itemsets": itemsets}, columns=["support", "itemsets"])
+
+    bits = pack_columns(df)
+    counts = popcount(bits)
+    floor = max(1, int(np.ceil(min_support * n_rows - 1e-9)))
+
+    def expand(closed, core, items, item_bits, item_counts, count):
+        """
+        :param closed: Tuple of item indexes; a closed itemset
+        :param core: Int; item added last, whose extensions are only by later items
+        :param items: Int array; items not in closed that are frequent when added to it, ascending
+        :param item_bits: 2D uint64 array; parallel to items, bitsets of closed + item (narrowed)
+        :param item_counts: Int array; parallel to items, number of rows with closed + item
+        :param count: Int; number of rows with closed
+        """
+        if closed and (not maximal or len(items) == 0):
+            supports.append(count / n_rows)
+            itemsets.append(frozenset(labels[j] for j in closed))
+
+        for i in np.flatnonzero(items > core):
+            words = np.flatnonzero(item_bits[i])
+            if len(words) < item_bits.shape[1] // 2:
+                joined = item_bits[:, words] & item_bits[i, words]
+            else:  # narrowing would cost more than it saves
+                joined = item_bits & item_bits[i]
+            joined_counts = popcount(joined)
+            closure = joined_counts == item_counts[i]
+            if closure[:i].any():
+                continue  # not prefix-preserving: found from another closed itemset instead
+            keep = ~closure & (joined_counts >= floor)
+            expand(closed + tuple(items[closure]), items[i], items[keep], joined[keep], joined_counts[keep],
+                   item_counts[i])
+
+    if counts.max() >= floor:
+        closed = np.flatnonzero(counts == n_rows)
+        frequent = np.flatnonzero((counts >= floor) & (counts < n_rows))
+        expand(tuple(closed), -1, frequent, bits[frequent], counts[frequent], n_rows)
+    itemsets = pd.DataFrame({"support": supports, "itemsets": itemsets}, columns=["support", "itemsets"])
+    return itemsets.sort_values(by=["support"], ascending=False, kind="stable").reset_index(drop=True)
+
+
+# Columns of tables of rules made here: those of mlxtend's association_rules() (as of mlxtend 0.25)
+RULE_COLUMNS = ["antecedents", "consequents", "antecedent support", "consequent support", "support", "confidence",
+                "lift", "representativity", "leverage", "conviction", "zhangs_metric", "jaccard", "certainty",
+                "kulczynski"]
+
+
+def rule_table(
+        antecedents,
+        consequents,
+        antecedent_support,
+        consequent_support,
+        support
+):
+    """
+    Computes every metric of RULE_COLUMNS from the supports of rules, the same way as association_rules() does for
+    transactions without missing values.
+    :param antecedents: List of frozensets
+    :param consequents: List of frozensets; parallel to antecedents
+    :param antecedent_support: Float array; parallel to antecedents
+    :param consequent_support: Float array; parallel to antecedents
+    :param support: Float array; parallel to antecedents, support of antecedent and consequent together
+    :return: DataFrame with RULE_COLUMNS
+    """
+    a_support = np.asarray(antecedent_support, dtype=float)
+    c_support = np.asarray(consequent_support, dtype=float)
+    support = np.asarray(support, dtype=float)
+    leverage = support - a_support * c_support
+    with np.errstate(divide="ignore", invalid="ignore"):
+        confidence = support / a_support
+        zhang_denominator = np.maximum(support * (1 - a_support), a_support * (c_support - support))
+        return pd.DataFrame({
+            "antecedents": list(antecedents),
+            "consequents": list(consequents),
+            "antecedent support": a_support,
+            "consequent support": c_support,
+            "support": support,
+            "confidence": confidence,
+            "lift": confidence / c_support,
+            "representativity": np.ones(len(support)),
+            "leverage": leverage,
+            "conviction": np.where(confidence < 1, (1 - c_support) / (1 - confidence), np.inf),
+            "zhangs_metric": np.where(zhang_denominator == 0, 0, leverage / zhang_denominator),
+            "jaccard": support / (a_support + c_support - support),
+            "certainty": np.where(c_support == 1, 0, (confidence - c_support) / (1 - c_support)),
+            "kulczynski": (confidence + support / c_support) / 2
+        }, columns=RULE_COLUMNS)
+
+
+def constrained_rules(
+        itemsets,
+        metric="confidence",
+        min_threshold=0.8,
+        antecedent_items=None,
+        consequent_items=None,
+        required_items=None
+):
+    """
+    Makes the same rules as association_rules() from frequent itemsets, in the same order, but only those that meet
+    constraints, without making the others: itemsets without a consequent item (or without a required item) aren't
+    split at all, and the rest are only split into antecedents of allowed items.
+    :param itemsets: DataFrame; frequent itemsets with "support" and "itemsets" columns (all of them, since the
+        supports of antecedents and consequents are looked up among them)
+    :param metric: name of a metric in RULE_COLUMNS, e.g. "confidence" or "lift"
+    :param min_threshold: Float; minimum value of metric
+    :param antecedent_items: Set of items or None (all); items allowed in antecedents
+    :param consequent_items: Set of items or None (all); consequents have at least one of these items
+    :param required_items: Set of items or None; if given, rules have at least one of these items
+    :return: DataFrame with RULE_COLUMNS, numbered from 0
+    """
+    if metric not in RULE_COLUMNS[2:]:
+        raise ValueError(f"invalid metric argument: must be one of {RULE_COLUMNS[2:]}")
+    # Rebuilt like association_rules() does, which can change the order they iterate in, and so of their rules
+    supports = dict(zip((frozenset(item for item in itemset) for itemset in itemsets["itemsets"]), itemsets["support"]))
+    antecedents, consequents, rule_supports = [], [], []
+
+    for itemset, support in supports.items():
+        if len(itemset) < 2 or (required_items is not None and itemset.isdisjoint(required_items)):
+            continue
+        if consequent_items is not None and itemset.isdisjoint(consequent_items):
+            continue
+        # Only subsets of free items can be antecedents, in the order association_rules() makes them
+        free = tuple(item for item in itemset if antecedent_items is None or item in antecedent_items)
+        for size in range(min(len(itemset) - 1, len(free)), 0, -1):
+            for antecedent in itertools.combinations(free, size):
+                antecedent = frozenset(antecedent)
+                consequent = itemset.difference(antecedent)
+                if consequent_items is not None and consequent.isdisjoint(consequent_items):
+                    continue
+                antecedents.append(antecedent)
+                consequents.append(consequent)
+                rule_supports.append((supports[antecedent], supports[consequent], support))
+
+    rule_supports = np.array(rule_supports, dtype=float).reshape(-1, 3)
+    table = rule_table(antecedents, consequents, rule_supports[:, 0], rule_supports[:, 1], rule_supports[:, 2])
+    return table[table[metric].to_numpy() >= min_threshold].reset_index(drop=True)
+
+
+# Position of the first set bit in each possible byte, in np.packbits() order (8 if none)
+_BYTE_FIRST_BITS = np.array([8 - i.bit_length() for i in range(256)], dtype=np.int64)
+
+# Queries of supersets are ANDed in batches of at most this many bytes (see closed_rules())
+_SUPERSET_BATCH_BYTES = 2 ** 24
+
+
+def closed_rules(
+        itemsets,
+        maximal=False
+):
+    """
+    Makes every rule with one antecedent item, {a} -> X - {a} for each frequent itemset X of at least two items
+    and each item a in X, from closed itemsets only (see lcm()): every frequent itemset is a subset of a closed
+    one, and has the support of its closure, i.e. of the most frequent closed itemset containing it. These are
+    the rules association_rules() makes from every frequent itemset that have one antecedent item, with the same
+    metrics, without making any rule with more.
+
+    With maximal, only rules {a} -> Z - {a} of maximal itemsets Z (closed itemsets with no closed, frequent
+    superset) are made: a condensed summary, of the longest rules only, not every rule.
+
+    Supports are found by ANDing, for each item of an itemset, a bitset of the closed itemsets that contain it.
+
+    :param itemsets: DataFrame; closed itemsets with "support" and "itemsets" columns, as returned by lcm()
+        (not only maximal ones)
+    :param maximal: Bool; whether to only make rules from maximal itemsets
+    :return: DataFrame with RULE_COLUMNS
+    """
+    itemsets = itemsets.sort_values(by=["support"], ascending=False, kind="stable")
+    closed = list(itemsets["itemsets"])
+    supports = itemsets["support"].to_numpy(dtype=float)
+    labels = list(dict.fromkeys(item for itemset in closed for item in itemset))
+    item_ids = {item: i for i, item in enumerate(labels)}
+    if not labels:
+        return rule_table([], [], [], [], [])
+
+    # Bit z of row i: whether closed itemset z contains item i; closed itemsets are most frequent first
+    membership = np.zeros((len(labels), len(closed)), dtype=bool)
+    for z, itemset in enumerate(closed):
+        membership[[item_ids[item] for item in itemset], z] = True
+    packed = np.packbits(membership, axis=1)
+
+    def supersets(queries):
+        """
+        :param queries: 2D Int array; one itemset of item ids per row
+        :return: 2D uint8 array; one row of packed bits per query, set for the closed itemsets containing it
+        """
+        result = np.empty((len(queries), packed.shape[1]), dtype=np.uint8)
+        batch = max(1, _SUPERSET_BATCH_BYTES // max(1, queries.shape[1] * packed.shape[1]))
+        for start in range(0, len(queries), batch):
+            result[start:start + batch] = np.bitwise_and.reduce(packed[queries[start:start + batch]], axis=1)
+        return result
+
+    def first_superset_supports(queries):
+        bits = supersets(queries)
+        first_byte = np.argmax(bits != 0, axis=1)
+        first = first_byte * 8 + _BYTE_FIRST_BITS[bits[np.arange(len(bits)), first_byte]]
+        return supports[first]
+
+    def closure_supports(queries):
+        """
+        :param queries: List of Tuples of item ids
+        :return: Float array; parallel to queries
+        """
+        result = np.empty(len(queries), dtype=float)
+        lengths = np.array([len(q) for q in queries], dtype=np.int64)
+        for length in np.unique(lengths):
+            rows = np.flatnonzero(lengths == length)
+            result[rows] = first_superset_supports(np.array([queries[r] for r in rows], dtype=np.int64))
+        return result
+
+    sizes = np.array([len(itemset) for itemset in closed])
+    sources = np.flatnonzero(sizes >= 2)
+    if maximal and len(sources):
+        # Maximal if no other closed itemset contains it
+        for size in np.unique(sizes[sources]):
+            group = sources[sizes[sources] == size]
+            queries = np.array([sorted(item_ids[item] for item in closed[z]) for z in group])
+            only_itself = _BYTE_POPCOUNTS[supersets(queries)].sum(axis=1) == 1
+            sources = sources[~np.isin(sources, group[~only_itself])]
+
+    sources = [tuple(sorted(item_ids[item] for item in closed[z])) for z in sources]
+    if not maximal:
+        # Every frequent itemset of at least two items, as a subset of a closed one
+        sources = list(dict.fromkeys(
+            subset
+            for ids in sources
+            for size in range(2, len(ids) + 1)
+            for subset in itertools.combinations(ids, size)
+        ))
+
+    antecedents, consequents, joint = [], [], []
+    for ids in sources:
+        for a in ids:
+            antecedents.append((a,))
+            consequents.append(tuple(i for i in ids if i != a))
+            joint.append(ids)
+    source_supports = dict(zip(sources, closure_supports(sources)))
+
+    return rule_table(
+        [frozenset([labels[a[0]]]) for a in antecedents],
+        [frozenset(labels[i] for i in c) for c in consequents],
+        closure_supports(antecedents),
+        closure_supports(consequents),
+        np.array([source_supports[ids] for ids in joint], dtype=float)
+    )
+
+
+# Metrics top_k_rules() can rank by
+TOP_K_METRICS = ["lift", "confidence", "leverage"]
+
+
+def top_k_rules(
+        df,
+        k,
+        metric="lift",
+        min_support=0.0,
+        antecedent_items=None,
+        consequent_items=None,
+        required_items=None,
+        max_len=None
+):
+    """
+    Finds the k best rules by metric, with one consequent item each, by branch and bound on bitsets: for every
+    consequent, antecedents are grown depth-first (like eclat()), and the k best rules so far are kept in a heap.
+    The k-th best value is a bound that rises as the search goes, and anything that can't beat it is pruned:
+    whole consequents (lift can't be more than 1 / consequent support, and leverage can't be more than
+    consequent support * (1 - consequent support)), and extensions of an antecedent. Every extension adds at
+    least one of the items left to add, so its joint count is at most the largest joint count with one of them,
+    and its antecedent is held by at least the responses that have all of them but not the consequent; every
+    metric rises with joint count and falls with antecedent count, so this bounds confidence, lift and leverage.
+
+    With lift or confidence, the best rules are usually held by a handful of responses, so min_support is
+    kept as a floor on joint support.
+
+    :param df: DataFrame of Bools; one-hot encoded transactions (dense or sparse)
+    :param k: Int; number of rules
+    :param metric: one of TOP_K_METRICS
+    :param min_support: Float; minimum support of rules (antecedent and consequent together)
+    :param antecedent_items: Set of column names or None (all); items allowed in antecedents
+    :param consequent_items: Set of column names or None (all); items allowed as consequents
+    :param required_items: Set of column names or None; if given, rules have at least one of these items
+    :param max_len: Int or None; maximum number of items in antecedents
+    :return: DataFrame with RULE_COLUMNS, best first
+    """
+    labels = list(df.columns)
+    n_rows = len(df)
+    results = []  # heap of (value, tiebreak, antecedent ids, consequent id, antecedent count, joint count)
+    if n_rows == 0 or not labels or k < 1:
+        return rule_table([], [], [], [], [])
+
+    bits = pack_columns(df)
+    counts = popcount(bits)
+    floor = max(1, int(np.ceil(min_support * n_rows - 1e-9)))
+    antecedent_ids = [i for i, label in enumerate(labels) if antecedent_items is None or label in antecedent_items]
+    required = None if required_items is None else {i for i, label in enumerate(labels) if label in required_items}
+
+    def value(antecedent_count, joint_count, consequent_count):
+        confidence = joint_count / antecedent_count
+        if metric == "confidence":
+            return confidence
+        elif metric == "lift":
+            return confidence * n_rows / consequent_count
+        return joint_count / n_rows - antecedent_count * consequent_count / n_rows ** 2
+
+    def bound(joint_count, consequent_count):
+        """Best value of any rule with this consequent whose joint count is at most joint_count"""
+        if metric == "confidence":
+            return 1.0
+        elif metric == "lift":
+            return n_rows / consequent_count
+        return joint_count / n_rows * (1 - consequent_count / n_rows)
+
+    def threshold():
+        return results[0][0] if len(results) == k else -np.inf
+
+    def extend(consequent, prefix, items, item_bits, item_counts, joint_counts):
+        """
+        :param prefix: Tuple of item ids; antecedent so far
+        :param items: Int array; items that can be added to prefix, in search order
+        :param item_bits: 2D uint64 array; parallel to items, bitsets of prefix + item
+        :param item_counts: Int array; parallel to items, responses with prefix + item
+        :param joint_counts: Int array; parallel to items, responses with prefix + item and the consequent
+        """
+        consequent_count = counts[consequent]
+        for i, item in enumerate(items):
+            antecedent = prefix + (item,)
+            rule_value = value(item_counts[i], joint_counts[i], consequent_count)
+            allowed = required is None or consequent in required or not required.isdisjoint(antecedent)
+            if allowed and rule_value > threshold():
+                # Later rules sort lower on ties, so earlier ones are kept
+                entry = (rule_value, -next(order), antecedent, consequent, item_counts[i], joint_counts[i])
+                if len(results) == k:
+                    heapq.heapreplace(results, entry)
+                else:
+                    heapq.heappush(results, entry)
+
+            if max_len is not None and len(antecedent) >= max_len:
+                continue
+            if bound(joint_counts[i], consequent_count) <= threshold():
+                continue
+            joined = item_bits[i + 1:] & item_bits[i]
+            joined_joint = popcount(joined & bits[consequent])
+            keep = joined_joint >= floor
+            if not keep.any():
+                continue
+            max_joint = joined_joint[keep].max()
+            min_missing = popcount(np.bitwise_and.reduce(joined[keep], axis=0) & ~bits[consequent])
+            if value(max_joint + min_missing, max_joint, consequent_count) > threshold():
+                extend(consequent, antecedent, items[i + 1:][keep], joined[keep], popcount(joined[keep]),
+                       joined_joint[keep])
+
+    order = itertools.count()
+    consequents = [
+        i for i, label in enumerate(labels)
+        if (consequent_items is None or label in consequent_items) and counts[i] >= floor
+    ]
+    # Most promising consequents first, so the bound rises early
+    consequents.sort(key=lambda c: bound(counts[c], counts[c]), reverse=True)
+    for consequent in consequents:
+        if bound(counts[consequent], counts[consequent]) <= threshold():
+            break  # sorted, so no later consequent can do better either
+        items = np.array([i for i in antecedent_ids if i != consequent], dtype=np.int64)
+        joint = popcount(bits[items] & bits[consequent])
+        keep = joint >= floor
+        extend(consequent, (), items[keep], bits[items[keep]], counts[items[keep]], joint[keep])
+
+    results.sort(reverse=True)
+    return rule_table(
+        [frozenset(labels[i] for i in entry[2]) for entry in results],
+        [frozenset([labels[entry[3]]]) for entry in results],
+        np.array([entry[4] for entry in results], dtype=float) / n_rows,
+        np.array([counts[entry[3]] for entry in results], dtype=float) / n_rows,
+        np.array([entry[5] for entry in results], dtype=float) / n_rows
+    )
@@ -1,42 +1,73 @@
-from plotters import PandasPlotter, PandasPlotDisplay, AssociationMetricPlotter
-from miner import AssociationMiner
-from snsplotters import HeatMapPlotter
-from helpers import DataCleaner, ResponseParser
-from constants import *
-
-
-def main():
-    plotter = PandasPlotter("data/responses.tsv", export_to_csv=True)
-    # plotter.plot_music_band_by_age()
-    # plotter.plot_chara_band_by_age()
-    # plotter.plot_music_band_by_region()
-    # plotter.plot_chara_band_by_region()
-    # plotter.plot_music_band_by_gender()
-    # plotter.plot_chara_band_by_gender()
-    # plotter.plot_play_style_by_age()
-    # plotter.plot_play_style_by_region()
-    # plotter.plot_play_style_by_gender()
-    # plotter.plot_participation_by_age()
-    # plotter.plot_participation_by_region()
-    # plotter.plot_participation_by_gender()
-
-    sns_plotter = HeatMapPlotter("data/responses.tsv", export_to_csv=True)
-    # sns_plotter.draw_gender_vs_region()
-    # sns_plotter.draw_age_vs_gender()
-    # sns_plotter.draw_age_vs_region()
-
-    miner = AssociationMiner("data/responses.tsv", export_to_csv=True)
-    # miner.mine_favorite_characters()
-    # miner.mine_favorite_band_members()
-    # miner.mine_favorite_character_reasons(antecedent="character")
-    # miner.mine_favorite_character_reasons(antecedent="reason")
-    # miner.mine_age_favorite_characters()
-    # miner.mine_gender_favorite_characters()
-    # miner.mine_region_favorite_characters()
-    # miner.mine_age_favorite_band_chara()
-    # miner.mine_gender_favorite_band_chara()
-    # miner.mine_region_favorite_band_chara()
-    # AssociationMetricPlotter.plot(rules, x_axis="support", y_axis="lift")
-
-
-main()
+"""
+Command-line entry point: runs ready-made plotting and mining methods (see runner.py).
+
+e.g. python main.py                          # everything
+     python main.py "mine_*" draw_age_vs_gender --workers 4 --output-dir output
+     python main.py "mine_favorite_character_reasons:antecedent=reason"
+     python main.py "mine_*" --profile mining.jsonl
+     python main.py "mine_*" --export-formats csv npz
+     python main.py "mine_*" --result-cache            # reuse rules mined by earlier runs, if still valid
+     python main.py --list
+"""
+
+import argparse
+import os
+import sys
+
+from dataset import SurveyDataset
+from exporters import WRITERS
+from runner import discover_jobs, select_jobs, run_jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Regenerate plots and mined rules from survey responses.")
+    parser.add_argument("jobs", nargs="*", help="method names or patterns, e.g. mine_* (default: all)")
+    parser.add_argument("--tsv", default="data/responses.tsv", help="path to survey responses")
+    parser.add_argument("--output-dir", default="output", help="folder to export into")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: number of CPUs)")
+    parser.add_argument("--profile", default=None, help="JSON-lines file to append timings of mining stages to")
+    parser.add_argument("--export-formats", nargs="+", default=["csv"], choices=sorted(WRITERS),
+                        help="formats to export mined rules in (default: csv)")
+    parser.add_argument("--result-cache", action="store_true",
+                        help="reuse rules mined by earlier runs that are still valid (cached in .cache/rules next to "
+                             "the survey)")
+    parser.add_argument("--list", action="store_true", help="list ready-made methods and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, (cls, _, _) in discover_jobs().items():
+            print(f"{name:<40} {cls.__name__}")
+        return 0
+
+    try:
+        jobs = select_jobs(args.jobs)
+    except ValueError as e:
+        parser.error(str(e))
+
+    def report(result):
+        status = "ok" if result.ok else "FAILED"
+        print(f"{result.job.name:<60} {result.elapsed:8.2f}s  {status}", flush=True)
+        if not result.ok:
+            print(result.error, file=sys.stderr, flush=True)
+
+    dataset = SurveyDataset(args.tsv)  # loaded once, shared by every job
+    results = run_jobs(
+        jobs,
+        dataset,
+        args.output_dir,
+        workers=args.workers,
+        on_result=report,
+        profile_path=args.profile,
+        export_formats=args.export_formats,
+        result_cache_dir=os.path.join(
+            os.path.dirname(os.path.abspath(args.tsv)), ".cache", "rules"
+        ) if args.result_cache else None
+    )
+
+    failed = [r for r in results if not r.ok]
+    print(f"{len(results) - len(failed)} of {len(results)} jobs succeeded")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
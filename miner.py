@@ -1,16 +1,62 @@
 from mlxtend.frequent_patterns import apriori, fpgrowth, association_rules
-from mlxtend.preprocessing import TransactionEncoder
+import hashlib
+import importlib
+import inspect
+import mlxtend
+import numpy as np
 import pandas as pd
-from functools import wraps
+from scipy.stats import hypergeom
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache, wraps
 
 from constants import *
-from helpers import DataCleaner, ResponseParser
+from dataset import OneHotTransactions, SurveyDataset
+from exporters import Exporter
+from instrumentation import Instrumentation, label, stage
+from itemsets import TOP_K_METRICS, closed_rules, constrained_rules, eclat, lcm, top_k_rules
+from resampling import (
+    FISHER_LOG_TOLERANCE, PermutationTest, TransactionPatterns, adjust_p_values, fisher_two_sided, percentile_interval
+)
+from rulearrays import RuleArrays
+from transactions import TransactionStore
+
+# Frequent itemset mining backends; all take a one-hot DataFrame and return the same table of itemsets
+ENGINES = {
+    "apriori": apriori,
+    "fpgrowth": fpgrowth,
+    "eclat": eclat
+}
+
+# Kinds of itemsets mine() can make rules from (see AssociationMiner.mine())
+ITEMSET_TYPES = ["all", "closed", "maximal"]
+
+# Modules whose code (and, for constants, legal values) ready-made methods' results depend on; their source is part
+# of the key of every cached result (see AssociationMiner._cached_result())
+RESULT_CACHE_MODULES = ["constants", "helpers", "transactions", "dataset", "itemsets", "rulearrays", __name__]
+
+# One-hot tables with at least this many cells (responses times legal values, i.e. bytes if dense) are sparse
+# by default (see AssociationMiner.mine())
+SPARSE_MIN_CELLS = 10 ** 8
+
+
+@lru_cache(maxsize=None)
+def _code_fingerprint():
+    """
+    :return: String; hash of the source of every module in RESULT_CACHE_MODULES, so that any change to the code or
+        legal values behind ready-made methods (not only to the methods themselves) invalidates cached results
+    """
+    digest = hashlib.sha256()
+    for name in RESULT_CACHE_MODULES:
+        digest.update(inspect.getsource(importlib.import_module(name)).encode())
+    return digest.hexdigest()
 
 
 def _can_export(f):
     """
     Decorator for AssociationMiner methods that return Rules.
-    If AssociationMiner is set to export to CSV, then exporting occurs.
+    If AssociationMiner has an exporter, then the rules are exported (in the background, unless the exporter
+    writes in the foreground; see Exporter).
     :param f: Method
     :return: Method
     """
@@ -27,20 +73,23 @@ def _can_export(f):
             "mine_age_favorite_band_chara": "age-and-favorite-band-for-characters",
             "mine_gender_favorite_band_chara": "gender-and-favorite-band-for-characters",
             "mine_region_favorite_band_chara": "region-and-favorite-band-for-characters",
-            "mine_region_favorite_seiyuu": "region-and-favorite-seiyuu"
+            "mine_region_favorite_seiyuu": "region-and-favorite-seiyuu",
+            "mine_favorite_songs": "favorite-songs",
+            "mine_favorite_seiyuu": "favorite-seiyuu"
         }
-        res = f(self, *args, **kwargs)  # Rules object
+        with label(self.instrumentation, f.__name__):
+            res = self._cached_result(f, args, kwargs)  # Rules object
 
-        if self.export_to_csv:
-            name = name_map[f.__name__]
-            if args:
-                name += "." + "".join(args)
-            if kwargs:
-                name += "." + "".join(kwargs.values())
+            if self.exporter is not None:  # each write is its own "export" stage, timed when it's written
+                name = name_map[f.__name__]
+                if args:
+                    name += "." + "".join(args)
+                if kwargs:
+                    name += "." + "".join(kwargs.values())
 
-            if res.table_organized is not None:
-                res.table_organized.to_csv(f"{name}.organized.csv")
-            res.table.to_csv(f"{name}.csv")
+                if res.table_organized is not None:
+                    self.exporter.export(res.table_organized, f"{name}.organized", self.instrumentation)
+                self.exporter.export(res.table, name, self.instrumentation)
 
         return res
 
@@ -56,31 +105,333 @@ class AssociationMiner:
     def __init__(
             self,
             tsv_path,
-            export_to_csv=False
+            export_to_csv=False,
+            engine="apriori",
+            itemset_cache_size=16,
+            instrumentation=None,
+            exporter=None,
+            result_cache=None
     ):
-        self.df = DataCleaner.prepare_data_frame(tsv_path)
+        """
+        :param tsv_path: String (path to survey responses) or SurveyDataset
+        :param export_to_csv: Bool; whether ready-made mining methods also export their rules to CSV, in the working
+            directory, before returning (ignored if exporter is given)
+        :param engine: "apriori", "fpgrowth", or "eclat"; default frequent itemset mining backend (see ENGINES)
+        :param itemset_cache_size: Int; how many sets of frequent itemsets to keep for reuse (0 to disable)
+        :param instrumentation: Instrumentation or None; if given, every stage of mining is measured
+            (see instrument())
+        :param exporter: Exporter or None; if given, ready-made mining methods export their rules with it
+            (e.g. Exporter("output", formats=["csv", "npz"])); call exporter.flush() to wait for the files
+        :param result_cache: ResultCache or None; if given, ready-made mining methods reuse rules they mined before,
+            as long as the data, their arguments, the engine, the code of RESULT_CACHE_MODULES, and library versions
+            are the same
+        """
+        self._check_engine(engine)
+        self.dataset = SurveyDataset.load(tsv_path)
+        self.df = self.dataset.df
         self.export_to_csv = export_to_csv
+        # Legacy CSV export writes before each method returns, as it always has, so files exist once it does
+        self.exporter = exporter if exporter is not None else Exporter(background=False) if export_to_csv else None
+        self.engine = engine
+        self.itemset_cache_size = itemset_cache_size
+        self.instrumentation = instrumentation
+        self.result_cache = result_cache
+        self._itemset_cache = OrderedDict()  # least recently used first
+
+    @contextmanager
+    def instrument(
+            self,
+            *sinks,
+            track_memory=True
+    ):
+        """
+        Context manager that measures the wall time, peak memory, and itemset and rule counts of each stage of
+        mining done inside it ("result_cache", "one_hot", "find_sets", "find_rules", "organize", and "export"),
+        labelled with the ready-made method they're part of. Background exports are reported as they're written,
+        so call exporter.flush() before reading their records.
+
+        e.g. with miner.instrument(print) as instrumentation:
+                 miner.mine_favorite_characters()
+             instrumentation.summary()
+
+        :param sinks: Functions taking a StageRecord, called as each stage finishes (e.g. LogSink())
+        :param track_memory: Bool; whether to measure peak memory (slows down mining while measuring)
+        :return: Instrumentation, holding all records once done
+        """
+        previous = self.instrumentation
+        self.instrumentation = Instrumentation(sinks, track_memory=track_memory)
+        try:
+            yield self.instrumentation
+        finally:
+            self.instrumentation = previous
+
+    def _cached_result(
+            self,
+            method,
+            args,
+            kwargs
+    ):
+        """
+        Calls a ready-made mining method, or loads the Rules it returned before from result_cache.
+        :param method: undecorated method
+        :param args: Tuple; positional arguments, besides self
+        :param kwargs: Dict
+        :return: Rules
+        """
+        if self.result_cache is None:
+            return method(self, *args, **kwargs)
+
+        call = inspect.signature(method).bind(self, *args, **kwargs)
+        call.apply_defaults()
+        arguments = sorted((name, value) for name, value in call.arguments.items() if name != "self")
+        key = self.result_cache.key(
+            self.dataset.fingerprint,
+            method.__name__,
+            arguments,
+            self.engine,
+            _code_fingerprint(),
+            mlxtend.__version__,
+            pd.__version__,
+            np.__version__
+        )
+
+        with stage(self.instrumentation, "result_cache") as info:
+            rules = self.result_cache.get(key)
+            info["hit"] = rules is not None
+        if rules is None:
+            rules = method(self, *args, **kwargs)
+            self.result_cache.put(key, rules)
+        return rules
 
     def mine(
             self,
             columns,
             column_values,
-            min_frequency=0.01,  # ~25 responses
+            min_frequency=None,
             metric="confidence",
-            metric_threshold=0.3
+            metric_threshold=0.3,
+            engine=None,
+            antecedent_columns=None,
+            consequent_items=None,
+            required_items=None,
+            sparse=None,
+            top_k=None,
+            itemset_type="all"
     ):
         """
         Generic function to mine rules from responses. Default metric is confidence > 30%.
         If confidence is too high, rules are too specific to individual people, as opinions vary quite a bit.
+
+        Rules can be constrained to the ones wanted, which is cheaper than mining everything and searching
+        afterwards: items that can't be in any wanted rule (in no antecedent column, and neither a consequent nor a
+        required item) aren't mined at all, and unwanted rules are never made: itemsets without a consequent (or
+        required) item aren't split into rules, and the rest are only split into allowed antecedents (see
+        itemsets.constrained_rules()). Constrained rules are the same as searching all rules afterwards, with the
+        same columns, in the same order, but numbered from 0.
+
+        With top_k, the top_k best rules by metric are returned instead (each with a single consequent), with no
+        metric_threshold to tune: the search keeps raising its own threshold as it finds better rules, and prunes
+        everything that can't beat it (see itemsets.top_k_rules()), so output size is bounded however skewed
+        the responses are. min_frequency then defaults to 0 (rules held by at least one response); a value given
+        is an extra floor on support, on top of the threshold the search raises itself. engine is unused.
+
+        With itemset_type "closed", only closed itemsets are mined (see itemsets.lcm()), which are much fewer than
+        every frequent itemset when answers are correlated, and rules are only made with one antecedent item, which
+        is all that's kept when organizing anyway (see itemsets.closed_rules()). The organized table has the same
+        rules, with the same metrics, as with "all". "maximal" is a condensed summary instead: only rules made from
+        maximal itemsets, i.e. the longest rules. engine is then unused.
+
         :param columns: List of column names to consider.
         :param column_values: List of column values each column can have (one list per column).
-        :param min_frequency: threshold frequency for itemset to be considered "frequent"
+        :param min_frequency: Float or None; threshold frequency for itemset to be considered "frequent".
+            None: 0.01 (~25 responses), or 0 with top_k
         :param metric: "confidence" or "lift"
         :param metric_threshold: Float, [0, 1]
+        :param engine: "apriori", "fpgrowth", "eclat", or None (use the miner's engine attribute)
+        :param antecedent_columns: List of column names or None; if given, antecedents only have values of these
+        :param consequent_items: List of Strings or None; if given, consequents have at least one of these values
+        :param required_items: List of Strings or None; if given, rules have at least one of these values
+        :param sparse: Bool or None; whether to mine from a sparse one-hot table, which keeps memory bounded when
+            there are many possible values (e.g. songs). None: only if the dense table would be large
+            (see SPARSE_MIN_CELLS)
+        :param top_k: Int or None; if given, number of rules to return, best first. metric must then be one of
+            TOP_K_METRICS
+        :param itemset_type: one of ITEMSET_TYPES; which frequent itemsets to make rules from. Not "all" only
+            without antecedent_columns, consequent_items and required_items
         :return: Rules
         """
-        raw_itemsets = self._generate_frequent_itemsets(columns, column_values, min_frequency)
-        return self._generate_association_rules(raw_itemsets, metric, metric_threshold)
+        engine = self.engine if engine is None else engine
+        self._check_engine(engine)
+        constrained = antecedent_columns is not None or consequent_items is not None or required_items is not None
+        if itemset_type not in ITEMSET_TYPES:
+            raise ValueError(f"invalid itemset_type argument: must be one of {ITEMSET_TYPES}")
+        if itemset_type != "all" and constrained:
+            raise ValueError("invalid itemset_type argument: must be 'all' with antecedent_columns, consequent_items "
+                             "or required_items")
+        if min_frequency is None:
+            min_frequency = 0.0 if top_k is not None else 0.01
+        if sparse is None:
+            sparse = len(self.df) * sum(len(values) for values in column_values) >= SPARSE_MIN_CELLS
+
+        transactions = OneHotTransactions(self.dataset, columns, column_values, sparse=sparse)
+        if top_k is not None:
+            return self._mine_top_k(
+                columns, column_values, top_k, metric, min_frequency, antecedent_columns, consequent_items,
+                required_items, sparse, transactions
+            )
+        if not constrained:
+            closed = itemset_type != "all"
+            raw_itemsets = self._generate_frequent_itemsets(
+                columns, column_values, min_frequency, engine, sparse=sparse, closed=closed
+            )
+            return self._generate_association_rules(
+                raw_itemsets, metric, metric_threshold, transactions, itemset_type=itemset_type
+            )
+
+        antecedent_items, consequent_items, required_items = self._constraint_items(
+            columns, column_values, antecedent_columns, consequent_items, required_items
+        )
+        items = antecedent_items | consequent_items | (required_items or set())
+        raw_itemsets = self._generate_frequent_itemsets(
+            columns, column_values, min_frequency, engine, items=items, sparse=sparse
+        )
+        with stage(self.instrumentation, "find_rules", itemsets=len(raw_itemsets)) as info:
+            rules = self._find_constrained_rules(
+                raw_itemsets, metric, metric_threshold, antecedent_items, consequent_items, required_items,
+                transactions
+            )
+            info["rules"] = len(rules.arrays)
+        self._organize(rules)
+        return rules
+
+    def _mine_top_k(
+            self,
+            columns,
+            column_values,
+            top_k,
+            metric,
+            min_frequency,
+            antecedent_columns,
+            consequent_items,
+            required_items,
+            sparse,
+            transactions
+    ):
+        """
+        mine()'s top-k mode. Takes the same arguments as mine().
+        :return: Rules
+        """
+        if metric not in TOP_K_METRICS:
+            raise ValueError(f"invalid metric argument: must be one of {TOP_K_METRICS} with top_k")
+        if int(top_k) != top_k or top_k < 1:
+            raise ValueError("invalid top_k argument: must be a positive integer")
+
+        antecedent_items, consequent_items, required_items = self._constraint_items(
+            columns, column_values, antecedent_columns, consequent_items, required_items
+        )
+        with stage(self.instrumentation, "one_hot"):
+            one_hot_df = self._transform_to_one_hot(columns, column_values, sparse=sparse)
+            items = antecedent_items | consequent_items
+            one_hot_df = one_hot_df[[c for c in one_hot_df.columns if c in items]]
+
+        with stage(self.instrumentation, "find_rules", top_k=top_k) as info:
+            table = top_k_rules(
+                one_hot_df, int(top_k), metric=metric, min_support=min_frequency, antecedent_items=antecedent_items,
+                consequent_items=consequent_items, required_items=required_items
+            )
+            rules = Rules(table, transactions)
+            info["rules"] = len(rules.arrays)
+
+        with stage(self.instrumentation, "organize", rules=len(rules.arrays)) as info:
+            rules.organize(sort_by=[metric], sort_ascending=[False])
+            info["organized_rules"] = len(rules.arrays_organized)
+        return rules
+
+    def sweep(
+            self,
+            columns,
+            column_values,
+            min_frequencies=(0.005, 0.01, 0.02),
+            metrics=("confidence",),
+            metric_thresholds=(0.2, 0.3, 0.4),
+            engine=None,
+            antecedent_columns=None,
+            consequent_items=None,
+            required_items=None,
+            sparse=None
+    ):
+        """
+        Mines rules for every combination of min_frequency, metric and metric_threshold, e.g. to tune mine()'s
+        thresholds, with a single mining pass: itemsets are only mined at the lowest min_frequency, and rules are
+        only made once per metric, at its lowest threshold. Every combination's rules are then a filter of those,
+        and are the same rules mine() would return (though rules tied in support may be in another order).
+
+        e.g. summary, rules = miner.sweep([CHARACTERS], [ALL_CHARACTERS], metrics=["confidence", "lift"],
+                                          metric_thresholds={"confidence": [0.2, 0.3], "lift": [1.1, 1.5]})
+             rules[(0.01, "lift", 1.5)].table_organized
+
+        :param columns: List of column names to consider.
+        :param column_values: List of column values each column can have (one list per column).
+        :param min_frequencies: List of Floats; thresholds frequency for itemsets to be considered "frequent"
+        :param metrics: List of metric names, e.g. "confidence" or "lift"
+        :param metric_thresholds: List of Floats (used for every metric), or Dict of metric name to List of Floats
+        :param engine: see mine()
+        :param antecedent_columns: see mine()
+        :param consequent_items: see mine()
+        :param required_items: see mine()
+        :param sparse: see mine()
+        :return: Tuple of (DataFrame with one row per combination: "min_frequency", "metric", "metric_threshold",
+            and the number of "rules" and "organized_rules", Dict of (min_frequency, metric, metric_threshold) to
+            Rules)
+        """
+        if not isinstance(metric_thresholds, dict):
+            metric_thresholds = {metric: metric_thresholds for metric in metrics}
+        if not min_frequencies or not metrics or any(not metric_thresholds.get(metric) for metric in metrics):
+            raise ValueError("invalid sweep arguments: every metric needs at least one threshold, and "
+                             "min_frequencies must not be empty")
+
+        engine = self.engine if engine is None else engine
+        self._check_engine(engine)
+        if sparse is None:
+            sparse = len(self.df) * sum(len(values) for values in column_values) >= SPARSE_MIN_CELLS
+        transactions = OneHotTransactions(self.dataset, columns, column_values, sparse=sparse)
+        constrained = antecedent_columns is not None or consequent_items is not None or required_items is not None
+
+        items = None
+        if constrained:
+            antecedent_items, consequent_items, required_items = self._constraint_items(
+                columns, column_values, antecedent_columns, consequent_items, required_items
+            )
+            items = antecedent_items | consequent_items | (required_items or set())
+        raw_itemsets = self._generate_frequent_itemsets(
+            columns, column_values, min(min_frequencies), engine, items=items, sparse=sparse
+        )
+
+        summary, results = [], dict()
+        for metric in metrics:
+            with stage(self.instrumentation, "find_rules", itemsets=len(raw_itemsets)) as info:
+                if constrained:
+                    all_rules = self._find_constrained_rules(
+                        raw_itemsets, metric, min(metric_thresholds[metric]), antecedent_items, consequent_items,
+                        required_items, transactions
+                    )
+                else:
+                    all_rules = self._find_rules(raw_itemsets, metric, min(metric_thresholds[metric]), transactions)
+                info["rules"] = len(all_rules.arrays)
+
+            arrays = all_rules.arrays
+            for min_frequency in min_frequencies:
+                for threshold in metric_thresholds[metric]:
+                    keep = (arrays.column("support") >= min_frequency) & (arrays.column(metric) >= threshold)
+                    rules = all_rules.derive(arrays.take(np.flatnonzero(keep), keep_index=False))
+                    self._organize(rules)
+                    results[(min_frequency, metric, threshold)] = rules
+                    summary.append((min_frequency, metric, threshold, len(rules.arrays), len(rules.arrays_organized)))
+
+        summary = pd.DataFrame(
+            summary, columns=["min_frequency", "metric", "metric_threshold", "rules", "organized_rules"]
+        )
+        return summary, results
 
     @_can_export
     def mine_favorite_characters(self):
@@ -120,14 +471,14 @@ class AssociationMiner:
             raise ValueError("invalid antecedent argument: must be 'all', 'character', or 'reason'")
 
         rules = self.mine([CHARACTERS, CHARACTER_REASONS], [ALL_CHARACTERS, ALL_CHARACTER_REASONS])
-        rules = Rules(rules.search(one_of=ALL_CHARACTER_REASONS))
+        rules = rules.derive(rules.search(one_of=ALL_CHARACTER_REASONS))
 
         if antecedent == "all":
             return rules
         elif antecedent == "character":
-            return Rules(rules.search(one_of=ALL_CHARACTERS, location="antecedents"))
+            return rules.derive(rules.search(one_of=ALL_CHARACTERS, location="antecedents"))
         elif antecedent == "reason":
-            return Rules(rules.search(one_of=ALL_CHARACTER_REASONS, location="antecedents"))
+            return rules.derive(rules.search(one_of=ALL_CHARACTER_REASONS, location="antecedents"))
 
     @_can_export
     def mine_age_favorite_characters(self):
@@ -138,14 +489,13 @@ class AssociationMiner:
         must be >30%, and less common age groups wouldn't make this threshold.
         :return Rules
         """
-        age_values = DataCleaner.filter_age(self.df)[AGE].unique().tolist()
-        table = self.mine(
-            [CHARACTERS, AGE], [ALL_CHARACTERS, age_values]
-        ).search(
-            one_of=age_values,
-            location="consequents"
+        age_values = self.dataset.filtered(AGE)[AGE].unique().tolist()
+        rules = self.mine(
+            [CHARACTERS, AGE], [ALL_CHARACTERS, age_values],
+            antecedent_columns=[CHARACTERS],
+            consequent_items=age_values
         )
-        return Rules(table)
+        return rules.derive(rules.arrays_organized)
 
     @_can_export
     def mine_gender_favorite_characters(self):
@@ -153,14 +503,13 @@ class AssociationMiner:
         Mines for rules that predict gender from favorite characters.
         :return Rules
         """
-        gender_values = DataCleaner.filter_gender(self.df)[GENDER].unique().tolist()
-        table = self.mine(
-            [CHARACTERS, GENDER], [ALL_CHARACTERS, gender_values]
-        ).search(
-            one_of=gender_values,
-            location="consequents"
+        gender_values = self.dataset.filtered(GENDER)[GENDER].unique().tolist()
+        rules = self.mine(
+            [CHARACTERS, GENDER], [ALL_CHARACTERS, gender_values],
+            antecedent_columns=[CHARACTERS],
+            consequent_items=gender_values
         )
-        return Rules(table)
+        return rules.derive(rules.arrays_organized)
 
     @_can_export
     def mine_region_favorite_characters(self):
@@ -168,47 +517,49 @@ class AssociationMiner:
         Mines for rules that predict region from favorite characters.
         :return Rules
         """
-        region_values = DataCleaner.filter_region(self.df, keep_all_legal=True)[REGION].unique().tolist()
-        table = self.mine(
-            [CHARACTERS, REGION], [ALL_CHARACTERS, region_values]
-        ).search(
-            one_of=region_values,
-            location="consequents"
+        region_values = self.dataset.filtered(REGION)[REGION].unique().tolist()
+        rules = self.mine(
+            [CHARACTERS, REGION], [ALL_CHARACTERS, region_values],
+            antecedent_columns=[CHARACTERS],
+            consequent_items=region_values
         )
-        return Rules(table)
+        return rules.derive(rules.arrays_organized)
 
     @_can_export
     def mine_age_favorite_band_chara(self):
         """
         :return: Rules
         """
-        values = DataCleaner.filter_age(self.df)[AGE].unique().tolist()
-        table = self.mine(
-            [BANDS_CHARA, AGE], [ALL_BANDS, values]
-        ).search(one_of=values)
-        return Rules(table)
+        values = self.dataset.filtered(AGE)[AGE].unique().tolist()
+        rules = self.mine(
+            [BANDS_CHARA, AGE], [ALL_BANDS, values],
+            required_items=values
+        )
+        return rules.derive(rules.arrays_organized)
 
     @_can_export
     def mine_gender_favorite_band_chara(self):
         """
         :return: Rules
         """
-        values = DataCleaner.filter_gender(self.df)[GENDER].unique().tolist()
-        table = self.mine(
-            [BANDS_CHARA, GENDER], [ALL_BANDS, values]
-        ).search(one_of=values)
-        return Rules(table)
+        values = self.dataset.filtered(GENDER)[GENDER].unique().tolist()
+        rules = self.mine(
+            [BANDS_CHARA, GENDER], [ALL_BANDS, values],
+            required_items=values
+        )
+        return rules.derive(rules.arrays_organized)
 
     @_can_export
     def mine_region_favorite_band_chara(self):
         """
         :return: Rules
         """
-        values = DataCleaner.filter_region(self.df)[REGION].unique().tolist()
-        table = self.mine(
-            [BANDS_CHARA, REGION], [ALL_BANDS, values]
-        ).search(one_of=values)
-        return Rules(table)
+        values = self.dataset.filtered(REGION)[REGION].unique().tolist()
+        rules = self.mine(
+            [BANDS_CHARA, REGION], [ALL_BANDS, values],
+            required_items=values
+        )
+        return rules.derive(rules.arrays_organized)
 
     @_can_export
     def mine_region_favorite_seiyuu(self):
@@ -217,62 +568,163 @@ class AssociationMiner:
         Note: The "Other" answer for favorite seiyuu is ignored.
         :return: Rules
         """
-        df = DataCleaner.filter_region(self.df)
-        regions = df[REGION].unique().tolist()
-        seiyuu = ResponseParser.unique_answers(df, SEIYUU)
+        regions = self.dataset.filtered(REGION)[REGION].unique().tolist()
+        seiyuu = self.dataset.unique_answers(SEIYUU, REGION)
         seiyuu.remove("Other")  # both regions and seiyuu have "Other" answer, so drop one of them
-        table = self.mine(
-            [REGION, SEIYUU], [regions, seiyuu]
-        ).search(one_of=regions)
-        return Rules(table)
+        rules = self.mine(
+            [REGION, SEIYUU], [regions, seiyuu],
+            required_items=regions
+        )
+        return rules.derive(rules.arrays_organized)
+
+    @_can_export
+    def mine_favorite_songs(self):
+        """
+        Mines for rules regarding all favorite original and cover songs.
+        There are hundreds of songs, so this mines from a sparse table.
+        Note: The "Other" answer for favorite songs is ignored.
+        :return: Rules
+        """
+        originals = [song for song in self.dataset.unique_answers(SONGS_ORIGINAL) if song != "Other"]
+        covers = [song for song in self.dataset.unique_answers(SONGS_COVER) if song != "Other"]
+        return self.mine([SONGS_ORIGINAL, SONGS_COVER], [originals, covers], sparse=True)
+
+    @_can_export
+    def mine_favorite_seiyuu(self):
+        """
+        Mines for rules regarding all favorite seiyuu.
+        Note: The "Other" and "I don't have a favorite seiyuu" answers are ignored.
+        :return: Rules
+        """
+        seiyuu = [
+            s for s in self.dataset.unique_answers(SEIYUU) if s not in ["Other", "I don't have a favorite seiyuu"]
+        ]
+        return self.mine([SEIYUU], [seiyuu], sparse=True)
 
     def _generate_frequent_itemsets(
             self,
             columns,
             column_values,
-            min_frequency
+            min_frequency,
+            engine="apriori",
+            items=None,
+            sparse=False,
+            closed=False
     ):
         """
         Uses the values of columns to generate frequent itemsets for association rule mining.
+
+        Results are cached per set of columns, legal values, and items (least recently used sets are evicted first).
+        Itemsets frequent at some threshold are a subset of those frequent at any lower threshold, so a cached
+        result also answers requests with a higher min_frequency, by filtering.
+
         :param columns: List of column names to use
         :param column_values: List; each element is itself a list, holding the legal values of the column
         :param min_frequency: threshold frequency for set to be considered "frequent"
+        :param engine: String; key of ENGINES
+        :param items: Set of Strings or None; if given, only itemsets made of these items are found
+        :param sparse: Bool; whether to mine from a sparse one-hot table (doesn't change results)
+        :param closed: Bool; whether to only find closed itemsets (with itemsets.lcm(), instead of engine)
         :return DataFrame
         """
-        lists = self._reduce(self.df, columns, column_values)
-        one_hot_df = self._transform_to_one_hot(lists)
-        return self._find_sets(one_hot_df, min_frequency=min_frequency)
+        key = (
+            frozenset((column, tuple(values)) for column, values in zip(columns, column_values)),
+            None if items is None else frozenset(items),
+            closed
+        )
+        engine = "lcm" if closed else engine
+        cached = self._itemset_cache.get(key)
+
+        if cached is not None and cached[0] <= min_frequency:
+            with stage(self.instrumentation, "find_sets", engine=engine, cached=True) as info:
+                self._itemset_cache.move_to_end(key)
+                itemsets = cached[1]
+                itemsets = itemsets[itemsets["support"] >= min_frequency]
+                info["itemsets"] = len(itemsets)
+            return itemsets
+
+        with stage(self.instrumentation, "one_hot") as info:
+            one_hot_df = self._transform_to_one_hot(columns, column_values, sparse=sparse)
+            if items is not None:
+                one_hot_df = one_hot_df[[c for c in one_hot_df.columns if c in items]]
+            info["transactions"], info["items"] = one_hot_df.shape
+        with stage(self.instrumentation, "find_sets", engine=engine, cached=False) as info:
+            itemsets = self._find_sets(one_hot_df, min_frequency=min_frequency, engine=engine, closed=closed)
+            info["itemsets"] = len(itemsets)
+
+        if self.itemset_cache_size > 0:
+            self._itemset_cache[key] = (min_frequency, itemsets)
+            self._itemset_cache.move_to_end(key)
+            while len(self._itemset_cache) > self.itemset_cache_size:
+                self._itemset_cache.popitem(last=False)
+        return itemsets.copy()
 
     def _generate_association_rules(
             self,
             itemsets,
             metric,
-            metric_threshold
+            metric_threshold,
+            transactions=None,
+            itemset_type="all"
     ):
         """
         Uses frequent itemsets to generate rules with 1 antecedent and sorted by lift.
-        :param itemsets: DataFrame
+        :param itemsets: DataFrame; closed itemsets, unless itemset_type is "all"
         :param metric: "confidence" or "lift"
         :param metric_threshold: Float, [0, 1]
+        :param transactions: see Rules()
+        :param itemset_type: one of ITEMSET_TYPES
         :return: Rules
         """
-        rules = self._find_rules(itemsets, metric, metric_threshold)
-        rules.organize(max_antecedents=1, sort_by=["lift"], sort_ascending=[False])
+        with stage(self.instrumentation, "find_rules", itemsets=len(itemsets)) as info:
+            if itemset_type == "all":
+                rules = self._find_rules(itemsets, metric, metric_threshold, transactions)
+            else:
+                rules = self._find_closed_rules(
+                    itemsets, metric, metric_threshold, transactions, maximal=itemset_type == "maximal"
+                )
+            info["rules"] = len(rules.arrays)
+        self._organize(rules)
         return rules
 
+    def _organize(
+            self,
+            rules
+    ):
+        """
+        Organizes rules to have 1 antecedent and be sorted by lift.
+        :param rules: Rules
+        """
+        with stage(self.instrumentation, "organize", rules=len(rules.arrays)) as info:
+            rules.organize(max_antecedents=1, sort_by=["lift"], sort_ascending=[False])
+            info["organized_rules"] = len(rules.arrays_organized)
+
     @staticmethod
     def _find_sets(
             one_hot_df,
-            min_frequency
+            min_frequency,
+            engine="apriori",
+            closed=False
     ):
         """
         Finds frequent itemsets.
         :param min_frequency: Float; threshold occurrence for a set to be considered "frequent"
+        :param engine: String; key of ENGINES
+        :param closed: Bool; whether to only find closed itemsets (with itemsets.lcm(), instead of engine)
         :return DataFrame
         """
-        itemsets = apriori(one_hot_df, min_support=min_frequency, use_colnames=True)
+        if closed:
+            return lcm(one_hot_df, min_support=min_frequency, use_colnames=True)
+        itemsets = ENGINES[engine](one_hot_df, min_support=min_frequency, use_colnames=True)
         return itemsets.sort_values(by=["support"], ascending=False)
 
+    @staticmethod
+    def _check_engine(
+            engine
+    ):
+        if engine not in ENGINES:
+            raise ValueError("invalid engine argument: must be 'apriori', 'fpgrowth', or 'eclat'")
+
     @staticmethod
     def _filter_itemsets(
             itemsets,
@@ -296,108 +748,195 @@ class AssociationMiner:
     def _find_rules(
             itemsets,
             metric,
-            metric_threshold
+            metric_threshold,
+            transactions=None
     ):
         """
         Uses itemsets attribute to find rules.
         :param metric: "confidence" or "lift"
         :param metric_threshold: Float, [0, 1]
+        :param transactions: see Rules()
         :return Rules
         """
-        return Rules(association_rules(itemsets, metric=metric, min_threshold=metric_threshold))
+        return Rules(association_rules(itemsets, metric=metric, min_threshold=metric_threshold), transactions)
 
     @staticmethod
-    def _reduce(
-            df,
-            column_list,
-            column_values_list
+    def _find_closed_rules(
+            itemsets,
+            metric,
+            metric_threshold,
+            transactions=None,
+            maximal=False
     ):
         """
-        Reduces a DataFrame to lists, where each list holds the values of the columns listed in column_list.
-        :param df: DataFrame
-        :param column_list: A list of columns to reduce to
-        :param column_values_list: A list parallel to column_list that lists values to look for in each column
-        :return List of Lists
+        Like _find_rules(), but from closed itemsets (see itemsets.closed_rules()).
+        :param itemsets: DataFrame; closed itemsets
+        :param metric: "confidence" or "lift"
+        :param metric_threshold: Float, [0, 1]
+        :param transactions: see Rules()
+        :param maximal: Bool; whether to only make rules from maximal itemsets
+        :return Rules
         """
-        rows = []
-
-        # remove rows with invalids in a column
-        for column in column_list:
-            df = DataCleaner.filter_invalids(df, column)
-        df.reset_index(drop=True, inplace=True)  # needed for enumeration/iteration to work
-
-        # Make rows
-        for _ in range(len(df)):
-            rows.append([])
+        rules = closed_rules(itemsets, maximal=maximal)
+        return Rules(rules[rules[metric] >= metric_threshold].reset_index(drop=True), transactions)
 
-        # Populate rows
-        for col_i, column in enumerate(column_list):
-            for row_i, column_value in df[column].items():
-                # Find all values in multi-response
-                legal_values = column_values_list[col_i]
-                found_values = []
-                for v in legal_values:
-                    if v in column_value:
-                        found_values.append(v)
-                rows[row_i].extend(found_values)
-
-        return rows
+    @staticmethod
+    def _find_constrained_rules(
+            itemsets,
+            metric,
+            metric_threshold,
+            antecedent_items,
+            consequent_items,
+            required_items=None,
+            transactions=None
+    ):
+        """
+        Like _find_rules(), but only makes rules that meet constraints (see itemsets.constrained_rules()).
+        :param itemsets: DataFrame; made of antecedent, consequent and required items only
+        :param metric: "confidence" or "lift"
+        :param metric_threshold: Float, [0, 1]
+        :param antecedent_items: Set of Strings; items allowed in antecedents
+        :param consequent_items: Set of Strings; consequents must have at least one of these items
+        :param required_items: Set of Strings or None; rules must have at least one of these items
+        :param transactions: see Rules()
+        :return Rules
+        """
+        return Rules(constrained_rules(
+            itemsets, metric=metric, min_threshold=metric_threshold, antecedent_items=antecedent_items,
+            consequent_items=consequent_items, required_items=required_items
+        ), transactions)
 
-    def _transform_to_one_hot(
+    def _constraint_items(
             self,
-            itemset_list
+            columns,
+            column_values,
+            antecedent_columns,
+            consequent_items,
+            required_items
     ):
         """
-        Converts itemset list into one-hot encoded DataFrame,
-        which is required for frequent itemset mining.
-        :param itemset_list: A list of lists
-        :return DataFrame
+        Translates constraints on rules into sets of item names (see TransactionStore.item_name()).
+        :return: Tuple of (antecedent items, consequent items, required items or None)
         """
-        encoder = TransactionEncoder()
-        array = encoder.fit(itemset_list).transform(itemset_list)
-        df = pd.DataFrame(array)
+        all_items = set(TransactionStore.item_name(v) for values in column_values for v in values)
+
+        if antecedent_columns is None:
+            antecedent_items = all_items
+        else:
+            antecedent_items = set(
+                TransactionStore.item_name(v)
+                for column, values in zip(columns, column_values) if column in antecedent_columns
+                for v in values
+            )
 
-        # rename columns
-        columns = self._parse_columns(encoder.columns_)
-        df.rename(columns={k: v for k, v in enumerate(columns)}, inplace=True)
+        if consequent_items is None:
+            consequent_items = all_items
+        else:
+            consequent_items = set(TransactionStore.item_name(v) for v in consequent_items) & all_items
 
-        return df
+        if required_items is not None:
+            required_items = set(TransactionStore.item_name(v) for v in required_items)
 
-    @staticmethod
-    def _parse_columns(
-            columns
+        return antecedent_items, consequent_items, required_items
+
+    def _transform_to_one_hot(
+            self,
+            columns,
+            column_values,
+            sparse=False
     ):
         """
-        Remove quotes in column names, because Pandas doesn't like them
+        Converts responses into a one-hot encoded DataFrame, which is required for frequent itemset mining.
+        Only responses with valid answers in every column are used. Parsing is shared through the dataset's
+        TransactionStore, so each column is only parsed once no matter how many times it's mined.
+        :param columns: List of column names to use
+        :param column_values: List; each element is itself a list, holding the legal values of the column
+        :param sparse: Bool; whether to return a sparse DataFrame
+        :return DataFrame
         """
-        res = []
-        for column in columns:
-            res.append(column.replace('"', ''))
-        return res
+        return self.dataset.transactions.one_hot(columns, column_values, sparse=sparse)
 
 
 class Rules:
     """
     Represents a set of association rules.
+
+    Rules are stored as RuleArrays (item ids and metric arrays), so filtering, sorting and searching them never
+    touches Python objects; the tables of frozensets (table and table_organized) are only decoded when first used.
     """
 
     def __init__(
             self,
-            df
+            df,
+            transactions=None
     ):
         """
-        :param df: DataFrame; original table that is always retained
+        :param df: DataFrame or RuleArrays; original table, which is only kept as RuleArrays
+        :param transactions: DataFrame (one-hot encoded), Function returning one (e.g. OneHotTransactions), or None;
+            the transactions the rules were mined from, needed for bootstrap() and permutation_test(); a Function is
+            only called when first needed. Only OneHotTransactions are pickled with the rules
         """
-        self._df = df
+        self._rules = df if isinstance(df, RuleArrays) else RuleArrays.from_frame(df)
+        self._organized = None
+        self._df = None  # decoded from _rules on demand, so a DataFrame given isn't kept alive
         self._organized_df = None
         self._sort_by = ["lift"]
         self._sort_ascending = [False]
+        self._indexes = dict()  # see _index()
+        self._transactions = transactions
+        self._transactions_df = transactions if isinstance(transactions, pd.DataFrame) else None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Rebuilt on demand, so not worth storing
+        state["_df"], state["_organized_df"], state["_indexes"] = None, None, dict()
+        # Never the table itself, which is usually much bigger than the rules, nor Functions (often unpicklable)
+        # besides OneHotTransactions, which rebuild it from the dataset when needed
+        state["_transactions_df"] = None
+        if not isinstance(self._transactions, OneHotTransactions):
+            state["_transactions"] = None
+        return state
+
+    @property
+    def transactions(self):
+        """
+        :return: DataFrame or None; one-hot encoded transactions the rules were mined from, if known
+        """
+        if self._transactions_df is None and callable(self._transactions):
+            self._transactions_df = self._transactions()
+        return self._transactions_df
+
+    def derive(
+            self,
+            df
+    ):
+        """
+        :param df: DataFrame or RuleArrays; some of these rules (e.g. search results, or arrays_organized)
+        :return: Rules; of df, mined from the same transactions
+        """
+        return Rules(df, self._transactions)
+
+    @property
+    def arrays(self):
+        """
+        :return: RuleArrays; the original table, undecoded
+        """
+        return self._rules
+
+    @property
+    def arrays_organized(self):
+        """
+        :return: RuleArrays or None; the organized table, undecoded
+        """
+        return self._organized
 
     @property
     def table(self):
         """
-        :return: DataFrame
+        :return: DataFrame; decoded from arrays when first used, then kept
         """
+        if self._df is None:
+            self._df = self._rules.to_frame()
         return self._df
 
     @property
@@ -405,6 +944,8 @@ class Rules:
         """
         :return: DataFrame
         """
+        if self._organized_df is None and self._organized is not None:
+            self._organized_df = self._organized.to_frame()
         return self._organized_df
 
     def search(
@@ -417,6 +958,10 @@ class Rules:
         Filters out rules that don't match search condition.
         E.g. if one_of=["Chisato", "Hina"], all rules with "Chisato" or "Hina" in antecedents or consequents
         will be returned.
+        A term that is exactly the name of an item only matches that item, so e.g. "Other" doesn't match
+        "Others"; otherwise it matches every item it is part of.
+        Uses an inverted index of items, so only the items are searched, not every rule, and only matching rules
+        are decoded.
 
         :param one_of: List; each element is search term, with entire list being a disjunction/OR
         :param location: "antecedents", "consequents", or "all"; where to look for search terms
@@ -426,31 +971,187 @@ class Rules:
         if location not in ["all", "antecedents", "consequents"]:
             raise ValueError("invalid location argument: must be 'all', 'antecedents', or 'consequents'")
 
-        if use_organized and self._organized_df is not None:
-            rules = self._organized_df.copy()
-        else:
-            rules = self._df.copy()
+        organized = use_organized and self._organized is not None
+        rules = self._organized if organized else self._rules
+        locations = ["antecedents", "consequents"] if location == "all" else [location]
 
-        res = None
-        filter_partials = []
+        # Union the posting lists of every item matching a term
+        partials = [np.empty(0, dtype=np.int64)]
+        for loc in locations:
+            index = self._index(organized, loc)
+            for term in one_of:
+                for item in self._matching_items(index, term):
+                    partials.append(index[item])
+        results = rules.take(np.unique(np.concatenate(partials)))
 
-        for term in one_of:
+        # Resort with original sort order
+        return results.take(results.sort_order(self._sort_by, self._sort_ascending)).to_frame()
 
-            # Do filtering/search of term at specified locations
-            if location == "all":
-                filter_partials.append(rules[rules["antecedents"].astype(str).str.contains(term)])
-                filter_partials.append(rules[rules["consequents"].astype(str).str.contains(term)])
-            else:
-                filter_partials.append(rules[rules[location].astype(str).str.contains(term)])
+    def _index(
+            self,
+            organized,
+            location
+    ):
+        """
+        Inverted index from each item to the positions of rules that have it at location.
+        Built the first time it's needed for a table.
+        :param organized: Bool; whether to index the organized table or the original one
+        :param location: "antecedents" or "consequents"
+        :return: Dict of String to Int array
+        """
+        key = (organized, location)
+        if key not in self._indexes:
+            self._indexes[key] = (self._organized if organized else self._rules).postings(location)
+        return self._indexes[key]
 
-            # Union partial filter results to get final result
-            if res is not None:
-                filter_partials.append(res)
-            res = pd.concat(filter_partials).drop_duplicates()
-            filter_partials = []
+    @staticmethod
+    def _matching_items(
+            index,
+            term
+    ):
+        """
+        :param index: Dict; see _index()
+        :param term: String; item name, or part of one (e.g. "Chisato" for "Shirasagi Chisato")
+        :return: List of Strings; the item named term if there is one, otherwise all items containing term
+        """
+        term = TransactionStore.item_name(term)
+        if term in index:
+            return [term]
+        return [item for item in index if term in item]
 
-        # Resort with original sort order
-        return res.sort_values(by=self._sort_by, ascending=self._sort_ascending)
+    def bootstrap(
+            self,
+            n_resamples=1000,
+            metrics=("support", "confidence", "lift"),
+            confidence_level=0.95,
+            random_state=None,
+            workers=1,
+            use_organized=True
+    ):
+        """
+        Estimates how much each rule's metrics would vary between samples of respondents, as percentile bootstrap
+        confidence intervals. Rules from small groups (e.g. one region or age) often have wide intervals.
+        Supports are recounted from resampled transactions (see TransactionPatterns.bootstrap_supports()),
+        without mining again.
+
+        :param n_resamples: Int
+        :param metrics: List of "support", "confidence", "lift", and/or "leverage"
+        :param confidence_level: Float, (0, 1)
+        :param random_state: Int or None; seed, for repeatable intervals
+        :param workers: Int; number of threads making resamples
+        :param use_organized: Bool; whether to use organized table or not
+        :return: DataFrame; the table, plus "<metric> low" and "<metric> high" columns for each metric
+        """
+        if self.transactions is None:
+            raise ValueError("invalid Rules: transactions they were mined from are unknown (see Rules())")
+        if not set(metrics) <= {"support", "confidence", "lift", "leverage"}:
+            raise ValueError("invalid metrics argument: must be 'support', 'confidence', 'lift', or 'leverage'")
+        if n_resamples < 1:
+            raise ValueError("invalid n_resamples argument: must be at least 1")
+        if not 0 < confidence_level < 1:
+            raise ValueError("invalid confidence_level argument: must be between 0 and 1")
+
+        organized = use_organized and self._organized is not None
+        rules = (self.table_organized if organized else self.table).copy()
+        if rules.empty:
+            return rules.assign(**{f"{metric} {end}": np.empty(0) for metric in metrics for end in ["low", "high"]})
+
+        itemsets = list(dict.fromkeys(
+            itemset
+            for a, c in zip(rules["antecedents"], rules["consequents"])
+            for itemset in (a, c, a | c)
+        ))
+        positions = {itemset: i for i, itemset in enumerate(itemsets)}
+        items = sorted(set().union(*itemsets))
+        patterns = TransactionPatterns(self.transactions, items)
+        supports = patterns.bootstrap_supports(itemsets, n_resamples, random_state=random_state, workers=workers)
+
+        a_support = supports[:, [positions[a] for a in rules["antecedents"]]]
+        c_support = supports[:, [positions[c] for c in rules["consequents"]]]
+        ac_support = supports[:, [positions[a | c] for a, c in zip(rules["antecedents"], rules["consequents"])]]
+        with np.errstate(divide="ignore", invalid="ignore"):  # itemsets missing from a resample
+            confidence = ac_support / a_support
+            resampled = {
+                "support": ac_support,
+                "confidence": confidence,
+                "lift": confidence / c_support,
+                "leverage": ac_support - a_support * c_support
+            }
+
+        for metric in metrics:
+            rules[f"{metric} low"], rules[f"{metric} high"] = percentile_interval(resampled[metric], confidence_level)
+        return rules
+
+    def permutation_test(
+            self,
+            n_permutations=1000,
+            alternative="greater",
+            correction="holm",
+            method="permutation",
+            random_state=None,
+            workers=1,
+            use_organized=True
+    ):
+        """
+        Tests whether each rule is more than chance: under the null hypothesis, antecedents and consequents are
+        independent, which is simulated by shuffling the consequent columns of the transactions between responses
+        and recounting the joint supports of every rule at once (see PermutationTest). Rules of small groups
+        (e.g. one region) with a lift a little over 1 are often no better than chance.
+
+        Under shuffling, a rule's joint count follows a hypergeometric distribution, so method="exact" gives the
+        p-values that permutations converge to (Fisher's exact test), without simulating. Two-sided, a joint count
+        is as extreme as the observed one if it's no more likely, as in scipy.stats.fisher_exact().
+
+        :param n_permutations: Int
+        :param alternative: "greater" (antecedent makes consequent more likely, i.e. lift > 1), "less", or
+            "two-sided"
+        :param correction: "holm", "bonferroni", "bh", or None; see adjust_p_values()
+        :param method: "permutation" or "exact"
+        :param random_state: Int or None; seed
+        :param workers: Int; number of processes shuffling
+        :param use_organized: Bool; whether to use organized table or not
+        :return: DataFrame; the table, plus "p-value" and "adjusted p-value" columns
+        """
+        if self.transactions is None:
+            raise ValueError("invalid Rules: transactions they were mined from are unknown (see Rules())")
+        if alternative not in ["greater", "less", "two-sided"]:
+            raise ValueError("invalid alternative argument: must be 'greater', 'less', or 'two-sided'")
+        if correction not in ["holm", "bonferroni", "bh", None]:
+            raise ValueError("invalid correction argument: must be 'holm', 'bonferroni', 'bh', or None")
+        if method not in ["permutation", "exact"]:
+            raise ValueError("invalid method argument: must be 'permutation' or 'exact'")
+        if method == "permutation" and n_permutations < 1:
+            raise ValueError("invalid n_permutations argument: must be at least 1")
+
+        organized = use_organized and self._organized is not None
+        rules = (self.table_organized if organized else self.table).copy()
+        if rules.empty:
+            return rules.assign(**{"p-value": np.empty(0), "adjusted p-value": np.empty(0)})
+        test = PermutationTest(self.transactions, list(rules["antecedents"]), list(rules["consequents"]))
+        observed = test.observed
+        null = hypergeom(test.n, test.consequent_counts, test.antecedent_counts)
+
+        if method == "exact":
+            if alternative == "greater":
+                p_values = null.sf(observed - 1)
+            elif alternative == "less":
+                p_values = null.cdf(observed)
+            else:
+                p_values = fisher_two_sided(test.n, test.antecedent_counts, test.consequent_counts, observed)
+            p_values = np.minimum(p_values, 1)
+        else:
+            permuted = test.permuted_counts(n_permutations, random_state=random_state, workers=workers)
+            if alternative == "greater":
+                extreme = permuted >= observed
+            elif alternative == "less":
+                extreme = permuted <= observed
+            else:
+                extreme = null.logpmf(permuted) <= null.logpmf(observed) + FISHER_LOG_TOLERANCE
+            p_values = (1 + extreme.sum(axis=0)) / (1 + n_permutations)
+
+        rules["p-value"] = p_values
+        rules["adjusted p-value"] = adjust_p_values(p_values, correction)
+        return rules
 
     def organize(
             self,
@@ -482,22 +1183,26 @@ class Rules:
         if sort_ascending is None:
             sort_ascending = ["False"]
 
-        rules = self._df.copy()
-        rules["antecedent_len"] = rules["antecedents"].apply(lambda x: len(x))
-        rules["consequent_len"] = rules["consequents"].apply(lambda x: len(x))
-        rules["rule_len"] = rules.apply(lambda row: row.antecedent_len + row.consequent_len, axis=1)
+        antecedent_len = self._rules.lengths("antecedents")
+        consequent_len = self._rules.lengths("consequents")
+        rule_len = antecedent_len + consequent_len
 
         # Filter
-        filtered = rules[
-            (rules["antecedent_len"] >= min_antecedents) &
-            (rules["consequent_len"] >= min_consequents) &
-            (rules["rule_len"] >= min_rule_length)
-            ]
-        filtered = filtered[filtered["antecedent_len"] <= max_antecedents] if max_antecedents else filtered
-        filtered = filtered[filtered["consequent_len"] <= max_consequents] if max_consequents else filtered
-        filtered = filtered[filtered["rule_len"] <= max_rule_length] if max_rule_length else filtered
+        keep = (
+            (antecedent_len >= min_antecedents) &
+            (consequent_len >= min_consequents) &
+            (rule_len >= min_rule_length)
+        )
+        keep &= antecedent_len <= max_antecedents if max_antecedents else True
+        keep &= consequent_len <= max_consequents if max_consequents else True
+        keep &= rule_len <= max_rule_length if max_rule_length else True
+        filtered = self._rules.take(np.flatnonzero(keep)).with_columns(
+            antecedent_len=antecedent_len[keep], consequent_len=consequent_len[keep], rule_len=rule_len[keep]
+        )
 
         # Sort
-        self._organized_df = filtered.sort_values(by=sort_by, ascending=sort_ascending)
+        self._organized = filtered.take(filtered.sort_order(sort_by, sort_ascending))
+        self._organized_df = None
+        self._indexes = {key: index for key, index in self._indexes.items() if not key[0]}
         self._sort_by = sort_by
         self._sort_ascending = sort_ascending
@@ -2,12 +2,73 @@
 Plotters that only require matplotlib and pandas.
 """
 
+import os
+
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 
 from constants import *
-from helpers import DataCleaner, ResponseParser
+from counts import DIMENSIONS
+from dataset import SurveyDataset
+from helpers import CORE_REGIONS, ResponseParser
+
+
+class FigureExporter:
+    """
+    Renders figures straight to files instead of showing them, for unattended (e.g. batch or worker process) use.
+    Figures are made on the Agg backend without going through pyplot, so no windows are opened, nothing blocks,
+    and no pyplot state is shared between plots.
+    """
+
+    def __init__(
+            self,
+            figure_dir,
+            figure_format="png"
+    ):
+        """
+        :param figure_dir: String; folder to save figures in (made if needed)
+        :param figure_format: String; file format and extension, e.g. "png" or "svg"
+        """
+        self.figure_dir = figure_dir
+        self.figure_format = figure_format
+
+    @staticmethod
+    def new_axes():
+        """
+        :return: Axes on a new Figure that isn't managed by pyplot
+        """
+        figure = Figure()
+        FigureCanvasAgg(figure)
+        return figure.add_subplot(1, 1, 1)
+
+    def save(
+            self,
+            figure,
+            name
+    ):
+        """
+        :param figure: Figure
+        :param name: String; file name, without extension
+        """
+        os.makedirs(self.figure_dir, exist_ok=True)
+        self.save_to(figure, os.path.join(self.figure_dir, f"{name}.{self.figure_format}"))
+
+    @staticmethod
+    def save_to(
+            figure,
+            path
+    ):
+        """
+        Saves figure, then frees it.
+        :param figure: Figure
+        :param path: String
+        """
+        figure.savefig(path, bbox_inches="tight")
+        figure.clear()
 
 
 class PandasPlotDisplay:
@@ -56,10 +117,18 @@ class PandasPlotter:
     characters or the regions (depending on the PandasPlotDisplay's attributes).
     """
 
-    def __init__(self, tsv_path, export_to_csv=False):
+    def __init__(self, tsv_path, export_to_csv=False, figure_dir=None, figure_format="png"):
+        """
+        :param tsv_path: String (path to survey responses) or SurveyDataset
+        :param export_to_csv: Bool; whether to also export plotted tables to CSV
+        :param figure_dir: String or None; if given, plots are saved in this folder instead of shown
+        :param figure_format: String; file format of saved plots, e.g. "png" or "svg"
+        """
         self.display = None
-        self.df = DataCleaner.prepare_data_frame(tsv_path)
+        self.dataset = SurveyDataset.load(tsv_path)
+        self.df = self.dataset.df
         self.export_to_csv = export_to_csv
+        self.figure_exporter = FigureExporter(figure_dir, figure_format) if figure_dir else None
 
     def plot_music_band_by_age(self, display=None):
         self.display = PandasPlotDisplay(
@@ -145,9 +214,10 @@ class PandasPlotter:
             annotation_size="x-small"
         ) if display is None else display
 
-        df = DataCleaner.filter_age(self.df)
-        raw, normalized = self._group_counts_for_answer(df, AGE, PLAY_STYLE)
-        self._plot_group_counts_for_answer(raw, normalized, sort=self.sort_ages)
+        raw, normalized = self._group_counts_for_answer(AGE, PLAY_STYLE)
+        self._plot_group_counts_for_answer(
+            raw, normalized, sort=self.sort_ages, figure_name=self._figure_name(AGE, PLAY_STYLE)
+        )
 
         self.display = None
 
@@ -164,9 +234,11 @@ class PandasPlotter:
             annotation_size="x-small"
         ) if display is None else display
 
-        df = DataCleaner.filter_region(self.df, keep_all_legal=show_all)
-        raw, normalized = self._group_counts_for_answer(df, REGION, PLAY_STYLE)
-        self._plot_group_counts_for_answer(raw, normalized, sort=sort)
+        raw, normalized = self._group_counts_for_answer(REGION, PLAY_STYLE, show_all=show_all)
+        self._plot_group_counts_for_answer(
+            raw, normalized, sort=sort, figure_name=self._figure_name(REGION, PLAY_STYLE, show_all),
+            csv_name=self._region_csv_name(show_all)
+        )
 
         self.display = None
 
@@ -180,9 +252,8 @@ class PandasPlotter:
             annotation_size="medium"
         ) if display is None else display
 
-        df = DataCleaner.filter_gender(self.df)
-        raw, normalized = self._group_counts_for_answer(df, GENDER, PLAY_STYLE)
-        self._plot_group_counts_for_answer(raw, normalized)
+        raw, normalized = self._group_counts_for_answer(GENDER, PLAY_STYLE)
+        self._plot_group_counts_for_answer(raw, normalized, figure_name=self._figure_name(GENDER, PLAY_STYLE))
 
         self.display = None
 
@@ -196,9 +267,10 @@ class PandasPlotter:
             annotation_size="xx-small"
         ) if display is None else display
 
-        df = DataCleaner.filter_age(self.df)
-        raw, normalized = self._group_counts_for_answer(df, AGE, FRANCHISE_PARTICIPATION)
-        self._plot_group_counts_for_answer(raw, normalized, sort=self.sort_ages)
+        raw, normalized = self._group_counts_for_answer(AGE, FRANCHISE_PARTICIPATION)
+        self._plot_group_counts_for_answer(
+            raw, normalized, sort=self.sort_ages, figure_name=self._figure_name(AGE, FRANCHISE_PARTICIPATION)
+        )
 
         self.display = None
 
@@ -215,9 +287,11 @@ class PandasPlotter:
             annotation_size="x-small"
         ) if display is None else display
 
-        df = DataCleaner.filter_region(self.df, keep_all_legal=show_all)
-        raw, normalized = self._group_counts_for_answer(df, REGION, FRANCHISE_PARTICIPATION)
-        self._plot_group_counts_for_answer(raw, normalized, sort=sort)
+        raw, normalized = self._group_counts_for_answer(REGION, FRANCHISE_PARTICIPATION, show_all=show_all)
+        self._plot_group_counts_for_answer(
+            raw, normalized, sort=sort, figure_name=self._figure_name(REGION, FRANCHISE_PARTICIPATION, show_all),
+            csv_name=self._region_csv_name(show_all)
+        )
 
         self.display = None
 
@@ -231,9 +305,10 @@ class PandasPlotter:
             annotation_size="x-small"
         ) if display is None else display
 
-        df = DataCleaner.filter_gender(self.df)
-        raw, normalized = self._group_counts_for_answer(df, GENDER, FRANCHISE_PARTICIPATION)
-        self._plot_group_counts_for_answer(raw, normalized)
+        raw, normalized = self._group_counts_for_answer(GENDER, FRANCHISE_PARTICIPATION)
+        self._plot_group_counts_for_answer(
+            raw, normalized, figure_name=self._figure_name(GENDER, FRANCHISE_PARTICIPATION)
+        )
 
         self.display = None
 
@@ -241,12 +316,11 @@ class PandasPlotter:
             self,
             band_col
     ):
-        df = DataCleaner.filter_age(self.df)
         counts, counts_norm = self._group_counts_for_answer(
-            df, stat_col=AGE, answer_col=band_col, answer_values=ALL_BANDS
+            stat_col=AGE, answer_col=band_col, answer_values=ALL_BANDS
         )
         self._plot_group_counts_for_answer(
-            counts, counts_norm, sort=self.sort_ages
+            counts, counts_norm, sort=self.sort_ages, figure_name=self._figure_name(AGE, band_col)
         )
 
     def _plot_band_by_region(
@@ -257,41 +331,41 @@ class PandasPlotter:
         def data_sort(c, c_norm):
             return self.sort_regions(c, c_norm, data_has_all=show_all)
 
-        df = DataCleaner.filter_region(self.df, show_all)
         counts, counts_norm = self._group_counts_for_answer(
-            df, stat_col=REGION, answer_col=band_col, answer_values=ALL_BANDS
+            stat_col=REGION, answer_col=band_col, answer_values=ALL_BANDS, show_all=show_all
         )
         self._plot_group_counts_for_answer(
-            counts, counts_norm, sort=data_sort
+            counts, counts_norm, sort=data_sort, figure_name=self._figure_name(REGION, band_col, show_all),
+            csv_name=self._region_csv_name(show_all)
         )
 
     def _plot_band_by_gender(
             self,
             band_col
     ):
-        df = DataCleaner.filter_gender(self.df)
         counts, counts_norm = self._group_counts_for_answer(
-            df, stat_col=GENDER, answer_col=band_col, answer_values=ALL_BANDS
+            stat_col=GENDER, answer_col=band_col, answer_values=ALL_BANDS
         )
         self._plot_group_counts_for_answer(
-            counts, counts_norm
+            counts, counts_norm, figure_name=self._figure_name(GENDER, band_col)
         )
 
-    @staticmethod
     def _group_counts_for_answer(
-            df,
+            self,
             stat_col,
             answer_col,
-            answer_values=None
+            answer_values=None,
+            show_all=True,
+            df=None
     ):
         """
         For each statistical group (e.g. people from Oceania),
         make new DataFrames consisting of number of respondents that gave an
         answer to the question represented by answer_col (e.g. favorite characters).
         Each column is an answer value, and each row is a group in the statistic.
-
-        The elements of answer_values should not be substrings of each other,
-        or that will match false-positives.
+        For REGION, AGE and GENDER (see counts.DIMENSIONS), counts are sliced from the dataset's shared CountCube,
+        so no responses are rescanned; any other stat_col, or responses given as df (e.g. filtered some other way),
+        are counted with a group-by.
 
         If answer_values is None, the responses are split on commas, parentheses and
         their contents are removed, and the resulting elements are taken as the
@@ -302,50 +376,43 @@ class PandasPlotter:
         each cell tells you how many people in that age listed that band as a
         favorite music-wise.
 
-        :param df: DataFrame
         :param stat_col: String; column name
         :param answer_col: String; column name
         :param answer_values: List of Strings or None; all legal values for answer column
+        :param show_all: Bool; whether to keep regions with low sample sizes, if stat_col is REGION (unused with df)
+        :param df: DataFrame or None; responses to count, every group found in stat_col (default: the dataset's
+            valid responses for stat_col)
         :return: two DataFrames, one with raw counts and one with percentages in group
         """
 
         # If no answer values provided, get them by parsing all responses
         if answer_values is None:
-            answer_values = ResponseParser.unique_answers(df, answer_col)
-
-        rows = []
-        rows_normalized = []
-        groups = df[stat_col].unique()
-
-        for group in groups:
-            rows_in_stat_group = df.loc[df[stat_col] == group]
-            num_answered = dict()
-            num_answered_normalized = dict()
-
-            for answer in answer_values:
-                # * is reserved character, so escape it if required
-                try:
-                    answer_regex = list(answer)
-                    answer_regex.insert(answer.index("*"), "\\")
-                    answer_regex = "".join(answer_regex)
-                except ValueError:
-                    # no need to escape
-                    answer_regex = answer
-
-                try:
-                    rows_with_answer = rows_in_stat_group[answer_col].str.contains(answer_regex)
-                    num_answered[answer] = rows_with_answer.value_counts()[True]
-                    num_answered_normalized[answer] = rows_with_answer.value_counts(normalize=True)[True]
-                except KeyError:
-                    # nobody with in this group listed this answer
-                    num_answered[answer] = 0
-                    num_answered_normalized[answer] = 0
-
-            rows.append(num_answered)
-            rows_normalized.append(num_answered_normalized)
-
-        non_normalized = pd.DataFrame(rows, index=groups, columns=answer_values)
-        normalized = pd.DataFrame(rows_normalized, index=groups, columns=answer_values)
+            if df is None:
+                answer_values = self.dataset.unique_answers(answer_col, stat_col, keep_all_legal=show_all)
+            else:
+                answer_values = ResponseParser.unique_answers(df, answer_col)
+
+        if df is None and stat_col in DIMENSIONS:
+            groups = CORE_REGIONS if stat_col == REGION and not show_all else None
+            return self.dataset.counts.group_counts(stat_col, answer_col, answer_values, groups=groups)
+
+        # Find who gave each answer once, then count per group with a single group-by over group codes
+        if df is None:
+            df = self.dataset.filtered(stat_col)
+        codes, groups = pd.factorize(df[stat_col])  # groups in order of appearance
+        groups = pd.Index(list(groups))  # plain, even if stat_col is categorical
+        indicators = ResponseParser.answer_indicators(df[answer_col], answer_values)
+        indicators = np.column_stack([indicators, df[answer_col].notna().to_numpy()])  # last column: responded
+        in_group = codes >= 0
+        sums = pd.DataFrame(indicators[in_group]).groupby(codes[in_group]).sum()
+        sums = sums.reindex(range(len(groups)), fill_value=0).to_numpy(dtype=np.int64)
+
+        counts, responded = sums[:, :-1], sums[:, -1:]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            proportions = np.where(responded > 0, counts / responded, 0.0)  # groups where nobody responded get 0
+
+        non_normalized = pd.DataFrame(counts, index=groups, columns=answer_values)
+        normalized = pd.DataFrame(proportions, index=groups, columns=answer_values)
         return non_normalized, normalized
 
     @staticmethod
@@ -403,27 +470,70 @@ class PandasPlotter:
             self,
             counts,
             counts_normalized,
-            sort=None
+            sort=None,
+            figure_name="bar",
+            csv_name=None
     ):
         if sort:
             counts, counts_normalized = sort(counts, counts_normalized)
         if self.display.transpose:
             counts, counts_normalized = counts.transpose(), counts_normalized.transpose()
 
-        ax = counts_normalized.plot(kind=self.display.kind, colormap=self.display.colormap, rot=0)
+        ax = counts_normalized.plot(
+            kind=self.display.kind,
+            colormap=self.display.colormap,
+            rot=0,
+            ax=self.figure_exporter.new_axes() if self.figure_exporter else None
+        )
         ax.yaxis.set_major_formatter(ticker.PercentFormatter(1.0))
         ax.yaxis.set_major_locator(ticker.MultipleLocator(0.05))  # add tick every 5%
-        plt.subplots_adjust(wspace=0.2)
+        ax.figure.subplots_adjust(wspace=0.2)
         ax.set_title(self.display.title)
         ax.set_xlabel(self.display.x_label)
         ax.set_ylabel(self.display.y_label)
 
         self._label_bars_with_raw_values(ax, counts)
-        plt.show()
+        if self.figure_exporter:
+            self.figure_exporter.save(ax.figure, figure_name)
+        else:
+            plt.show()
 
         if self.export_to_csv:
-            counts.to_csv(f"{self.display.title}.raw.csv")
-            counts_normalized.to_csv(f"{self.display.title}.normalized.csv")
+            csv_name = self.display.title if csv_name is None else csv_name
+            counts.to_csv(f"{csv_name}.raw.csv")
+            counts_normalized.to_csv(f"{csv_name}.normalized.csv")
+
+    def _region_csv_name(
+            self,
+            show_all
+    ):
+        """
+        :return: String; file name (without extension) of CSVs of counts by region, which differs between all
+            regions and core regions only, like _figure_name() (so both variants can be exported side by side)
+        """
+        return self.display.title if show_all else f"{self.display.title} (Core Regions)"
+
+    @staticmethod
+    def _figure_name(
+            stat_col,
+            answer_col,
+            show_all=True
+    ):
+        """
+        :return: String; file name (without extension) of a figure, matching output/pyplot-bar
+        """
+        stat_names = {
+            AGE: "age",
+            GENDER: "gender",
+            REGION: "full_region" if show_all else "region"
+        }
+        answer_names = {
+            BANDS_MUSIC: "band_music",
+            BANDS_CHARA: "band_chara",
+            PLAY_STYLE: "play_style",
+            FRANCHISE_PARTICIPATION: "participation"
+        }
+        return f"{stat_names[stat_col]}_vs_{answer_names[answer_col]}"
 
     def _label_bars_with_raw_values(
             self,
@@ -445,17 +555,28 @@ class AssociationMetricPlotter:
     def plot(
             rules,
             x_axis,
-            y_axis
+            y_axis,
+            path=None
     ):
         """
         Plots scatter graph of association rule metrics.
         :param rules: Rules
         :param x_axis: String of column name
         :param y_axis: String of column name
+        :param path: String or None; if given, the graph is saved to this file (format from its extension)
+            instead of being shown
         """
         x = rules.table[[x_axis]].to_numpy()
         y = rules.table[[y_axis]].to_numpy()
-        plt.scatter(x, y)
-        plt.xlabel(x_axis)
-        plt.ylabel(y_axis)
-        plt.show()
+
+        if path is None:
+            plt.scatter(x, y)
+            plt.xlabel(x_axis)
+            plt.ylabel(y_axis)
+            plt.show()
+        else:
+            ax = FigureExporter.new_axes()
+            ax.scatter(x, y)
+            ax.set_xlabel(x_axis)
+            ax.set_ylabel(y_axis)
+            FigureExporter.save_to(ax.figure, path)
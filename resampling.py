@@ -0,0 +1,341 @@
+"""
+Resampling of one-hot encoded transactions, for measuring how much rule metrics vary between samples.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from scipy.stats import hypergeom
+
+from itemsets import pack_columns
+
+# Largest number of (resample, pattern or response) cells made at once; bounds the memory of a batch of resamples
+BATCH_CELLS = 2 ** 24
+
+# Resamples are drawn as counts of each pattern (one multinomial draw) when patterns have at least this many
+# responses on average; otherwise, as indexes of responses, which is cheaper when most responses are unique
+MULTINOMIAL_MIN_RESPONSES_PER_PATTERN = 10
+
+# Log of the relative tolerance under which a table is as likely as the observed one in two-sided exact tests,
+# so rounding in the probabilities doesn't drop ties (the same as scipy.stats.fisher_exact())
+FISHER_LOG_TOLERANCE = np.log1p(1e-7)
+
+
+class TransactionPatterns:
+    """
+    The distinct rows (patterns) of a one-hot encoded table, restricted to some items, and how many responses
+    have each. Resampling responses only changes how many times each pattern is counted, and there are usually
+    far fewer patterns than responses, as most people give the same few combinations of answers.
+    """
+
+    def __init__(
+            self,
+            one_hot_df,
+            items
+    ):
+        """
+        :param one_hot_df: DataFrame of Bools; dense or sparse
+        :param items: List of column names of one_hot_df
+        """
+        if hasattr(one_hot_df, "sparse"):
+            rows = one_hot_df[items].sparse.to_coo().toarray() != 0
+        else:
+            rows = one_hot_df[items].to_numpy(dtype=bool)
+
+        self.items = list(items)
+        self.n = len(rows)
+        self.positions = {item: i for i, item in enumerate(self.items)}
+        if self.n == 0:
+            self.patterns, self.counts, self.row_patterns = rows, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=int)
+            return
+
+        packed = np.ascontiguousarray(np.packbits(rows, axis=1))
+        keys = packed.view(np.dtype((np.void, packed.shape[1]))).reshape(-1)
+        _, first, inverse, self.counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+        self.patterns = rows[first]  # 2D Bool array; one row per pattern, one column per item
+        self.row_patterns = inverse.reshape(-1)  # pattern of each response
+
+    def indicators(
+            self,
+            itemsets
+    ):
+        """
+        :param itemsets: List of iterables of items
+        :return: sparse matrix (CSC) of float32; one row per pattern, one column per itemset, 1 where the pattern
+            has every item of the itemset
+        """
+        n_patterns = len(self.patterns)
+        bits = pack_columns(pd.DataFrame(self.patterns))  # patterns that have each item, as bitsets
+        rows = [np.empty(0, dtype=np.int64)]
+        for itemset in itemsets:
+            common = np.bitwise_and.reduce(bits[[self.positions[item] for item in itemset]], axis=0)
+            rows.append(np.flatnonzero(np.unpackbits(common.view(np.uint8))[:n_patterns]))
+        indptr = np.zeros(len(itemsets) + 1, dtype=np.int64)
+        np.cumsum([len(r) for r in rows[1:]], out=indptr[1:])
+        indices = np.concatenate(rows)
+        return scipy.sparse.csc_matrix(
+            (np.ones(len(indices), dtype=np.float32), indices, indptr), shape=(n_patterns, len(itemsets))
+        )
+
+    def bootstrap_supports(
+            self,
+            itemsets,
+            n_resamples=1000,
+            random_state=None,
+            workers=1
+    ):
+        """
+        Supports of itemsets in bootstrap resamples of the responses (n responses, drawn with replacement).
+        A batch of resamples is a matrix of how many times each pattern was drawn, so the supports of every
+        itemset in the batch are one (sparse) matrix product, instead of counting in every resample.
+
+        Resamples are made in fixed-size batches, each from its own seed derived from random_state, so results
+        only depend on random_state, however many workers there are.
+
+        :param itemsets: List of iterables of items
+        :param n_resamples: Int
+        :param random_state: Int or None; seed
+        :param workers: Int; number of threads computing batches
+        :return: 2D Float array (float32); one row per resample, one column per itemset
+        """
+        supports = np.empty((n_resamples, len(itemsets)), dtype=np.float32)
+        if self.n == 0:
+            supports[:] = np.nan
+            return supports
+
+        found_by_itemset = self.indicators(itemsets).T.tocsr()
+        n_patterns = len(self.counts)
+        multinomial = self.n >= MULTINOMIAL_MIN_RESPONSES_PER_PATTERN * n_patterns
+        batch_size = max(1, min(n_resamples, BATCH_CELLS // (n_patterns if multinomial else self.n)))
+        starts = list(range(0, n_resamples, batch_size))
+        seeds = np.random.SeedSequence(random_state).spawn(len(starts))
+
+        def run_batch(start, seed):
+            rng = np.random.default_rng(seed)
+            size = min(batch_size, n_resamples - start)
+            if multinomial:
+                picks = rng.multinomial(self.n, self.counts / self.n, size=size)
+            else:
+                drawn = self.row_patterns[rng.integers(0, self.n, size=(size, self.n))]
+                drawn += np.arange(size)[:, None] * n_patterns  # a separate range of bins per resample
+                picks = np.bincount(drawn.reshape(-1), minlength=size * n_patterns).reshape(size, n_patterns)
+            supports[start:start + size] = (found_by_itemset @ picks.T.astype(np.float32)).T / self.n
+
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(run_batch, starts, seeds))  # list() re-raises errors
+        else:
+            for start, seed in zip(starts, seeds):
+                run_batch(start, seed)
+        return supports
+
+
+def percentile_interval(
+        values,
+        confidence_level=0.95
+):
+    """
+    Percentile interval of each column, ignoring NaNs (like np.nanpercentile(), but with one sort for all
+    columns instead of one per column).
+    :param values: 2D Float array; one row per resample
+    :param confidence_level: Float, (0, 1)
+    :return: two Float arrays (low and high), one element per column; NaN for columns without any values
+    """
+    values = np.sort(np.where(np.isfinite(values), values, np.nan), axis=0)  # NaNs sort last
+    valid = np.isfinite(values).sum(axis=0)
+    columns = np.arange(values.shape[1])
+    bounds = []
+    for q in [(1 - confidence_level) / 2, (1 + confidence_level) / 2]:
+        position = q * np.maximum(valid - 1, 0)
+        below = np.floor(position).astype(np.int64)
+        above = np.minimum(below + 1, np.maximum(valid - 1, 0))
+        low, high = values[below, columns], values[above, columns]
+        bound = low + (position - below) * (high - low)
+        bounds.append(np.where(valid > 0, bound, np.nan))
+    return bounds[0], bounds[1]
+
+
+class PermutationTest:
+    """
+    Joint counts of rules (antecedent and consequent pairs) when the consequent columns are shuffled between
+    responses, i.e. under the null hypothesis that antecedents and consequents are independent.
+
+    Only responses with some antecedent can count towards a joint count, so each permutation just draws the
+    responses whose consequents they're paired with. Responses are grouped into patterns on each side (see
+    TransactionPatterns), so each permutation is counted as a contingency table of antecedent patterns and paired
+    consequent patterns, turned into joint counts of every antecedent and consequent by two sparse matrix
+    products.
+    """
+
+    def __init__(
+            self,
+            one_hot_df,
+            antecedents,
+            consequents
+    ):
+        """
+        :param one_hot_df: DataFrame of Bools; dense or sparse
+        :param antecedents: List of frozensets of items; one per rule
+        :param consequents: List of frozensets of items; one per rule
+        """
+        unique_antecedents = list(dict.fromkeys(antecedents))
+        unique_consequents = list(dict.fromkeys(consequents))
+        a_positions = {a: i for i, a in enumerate(unique_antecedents)}
+        c_positions = {c: i for i, c in enumerate(unique_consequents)}
+        self.rule_antecedents = np.array([a_positions[a] for a in antecedents], dtype=np.int64)
+        self.rule_consequents = np.array([c_positions[c] for c in consequents], dtype=np.int64)
+
+        a_side = TransactionPatterns(one_hot_df, sorted(set().union(*unique_antecedents)))
+        c_side = TransactionPatterns(one_hot_df, sorted(set().union(*unique_consequents)))
+        self.n = a_side.n
+        self.a_found = a_side.indicators(unique_antecedents).tocsr()  # patterns x antecedents
+        self.a_found_by_antecedent = self.a_found.T.tocsr()
+        self.c_found = c_side.indicators(unique_consequents).tocsr()  # patterns x consequents
+        self.c_row_patterns = c_side.row_patterns
+
+        has_antecedent = np.diff(self.a_found.indptr) > 0
+        self.active_rows = np.flatnonzero(has_antecedent[a_side.row_patterns])  # responses with some antecedent
+        self.active_patterns = a_side.row_patterns[self.active_rows]
+
+        a_counts = self.a_found.T @ a_side.counts.astype(np.float32)
+        c_counts = self.c_found.T @ c_side.counts.astype(np.float32)
+        self.antecedent_counts = np.rint(a_counts[self.rule_antecedents]).astype(np.int64)
+        self.consequent_counts = np.rint(c_counts[self.rule_consequents]).astype(np.int64)
+        self.observed = self._joint_counts(self.active_rows[None, :])[0]
+
+    def permuted_counts(
+            self,
+            n_permutations=1000,
+            random_state=None,
+            workers=1
+    ):
+        """
+        Permutations are made in fixed-size batches, each from its own seed derived from random_state, so results
+        only depend on random_state, however many workers there are.
+        :param n_permutations: Int
+        :param random_state: Int or None; seed
+        :param workers: Int; number of processes counting batches (1 counts in this process)
+        :return: 2D Int array; one row per permutation, one column per rule
+        """
+        m = len(self.active_rows)
+        batch_size = max(1, min(n_permutations, BATCH_CELLS // max(m, 1)))
+        sizes = [min(batch_size, n_permutations - start) for start in range(0, n_permutations, batch_size)]
+        seeds = np.random.SeedSequence(random_state).spawn(len(sizes))
+
+        if workers > 1 and len(sizes) > 1:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("fork" if "fork" in methods else None)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                batches = list(pool.map(self._permuted_batch, sizes, seeds))
+        else:
+            batches = [self._permuted_batch(size, seed) for size, seed in zip(sizes, seeds)]
+        return np.concatenate(batches) if batches else np.zeros((0, len(self.observed)), dtype=np.int64)
+
+    def _permuted_batch(
+            self,
+            size,
+            seed
+    ):
+        rng = np.random.default_rng(seed)
+        partners = np.stack([rng.choice(self.n, size=len(self.active_rows), replace=False) for _ in range(size)])
+        return self._joint_counts(partners)
+
+    def _joint_counts(
+            self,
+            partners
+    ):
+        """
+        :param partners: 2D Int array; per permutation, the response each active response is paired with
+        :return: 2D Int array; per permutation, the joint count of each rule
+        """
+        counts = np.zeros((len(partners), len(self.rule_antecedents)), dtype=np.int64)
+        if counts.size == 0 or partners.shape[1] == 0:
+            return counts
+
+        shape = (self.a_found.shape[0], self.c_found.shape[0])
+        ones = np.ones(partners.shape[1], dtype=np.float32)
+        for i, paired in enumerate(partners):
+            # How many responses of each antecedent pattern are paired with each consequent pattern
+            table = scipy.sparse.csr_matrix((ones, (self.active_patterns, self.c_row_patterns[paired])), shape=shape)
+            joint = (self.a_found_by_antecedent @ table @ self.c_found).tocsr()  # antecedents x consequents
+            counts[i] = np.rint(np.asarray(joint[self.rule_antecedents, self.rule_consequents]).reshape(-1))
+        return counts
+
+
+def fisher_two_sided(
+        n,
+        antecedent_counts,
+        consequent_counts,
+        observed
+):
+    """
+    Two-sided p-values of Fisher's exact test (like scipy.stats.fisher_exact()) for many rules at once: the
+    probability, with antecedents and consequents independent, of a joint count no more likely than the observed
+    one. Joint counts follow a hypergeometric distribution, which rises to its mode and then falls, so the counts
+    that are no more likely are the observed count's own tail and a tail on the other side of the mode, whose
+    start is found with a binary search per rule.
+    :param n: Int; number of responses
+    :param antecedent_counts: Int array; number of responses with each rule's antecedents
+    :param consequent_counts: Int array; number of responses with each rule's consequents
+    :param observed: Int array; joint count of each rule
+    :return: Float array; one p-value per rule
+    """
+    null = hypergeom(n, consequent_counts, antecedent_counts)
+    threshold = null.logpmf(observed) + FISHER_LOG_TOLERANCE
+    lowest = np.maximum(0, antecedent_counts + consequent_counts - n)
+    highest = np.minimum(antecedent_counts, consequent_counts)
+    mode = (antecedent_counts + 1) * (consequent_counts + 1) // (n + 2)
+    below = observed < mode
+
+    # First count of the other tail: above the mode, the first that's no more likely (highest + 1 if none);
+    # below it, the first that's more likely
+    lo = np.where(below, mode, lowest)
+    hi = np.where(below, highest + 1, mode + 1)
+    while np.any(lo < hi):
+        mid = (lo + hi) // 2
+        unlikely = null.logpmf(mid) <= threshold
+        found = np.where(below, unlikely, ~unlikely) & (lo < hi)
+        hi = np.where(found, mid, hi)
+        lo = np.where(found | (lo >= hi), lo, mid + 1)
+
+    p_values = np.where(
+        below,
+        null.cdf(observed) + null.sf(lo - 1),
+        null.sf(observed - 1) + null.cdf(lo - 1)
+    )
+    return np.minimum(np.where(observed == mode, 1.0, p_values), 1)
+
+
+def adjust_p_values(
+        p_values,
+        correction="holm"
+):
+    """
+    Adjusts p-values for testing many hypotheses (e.g. every rule) at once.
+    :param p_values: Float array
+    :param correction: "holm" (Holm-Bonferroni; controls family-wise error), "bonferroni" (same, but more
+        conservative), "bh" (Benjamini-Hochberg; controls false discovery rate), or None (unadjusted)
+    :return: Float array; adjusted p-values, in the same order
+    """
+    p_values = np.asarray(p_values, dtype=float)
+    m = len(p_values)
+    if correction is None or m == 0:
+        return p_values.copy()
+    if correction == "bonferroni":
+        return np.minimum(p_values * m, 1)
+
+    order = np.argsort(p_values, kind="stable")
+    ranked = p_values[order]
+    if correction == "holm":
+        adjusted = np.maximum.accumulate(np.minimum(ranked * (m - np.arange(m)), 1))
+    elif correction == "bh":
+        adjusted = np.minimum.accumulate((ranked * m / np.arange(1, m + 1))[::-1])[::-1]
+        adjusted = np.minimum(adjusted, 1)
+    else:
+        raise ValueError("invalid correction argument: must be 'holm', 'bonferroni', 'bh', or None")
+    result = np.empty(m)
+    result[order] = adjusted
+    return result
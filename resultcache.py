@@ -0,0 +1,126 @@
+"""
+On-disk cache of mining results, addressed by the hash of everything they depend on.
+"""
+
+import glob
+import hashlib
+import os
+import time
+
+import pandas as pd
+
+
+class ResultCache:
+    """
+    Stores results (anything picklable, e.g. Rules) in files named by their key, so a result is reused for as long
+    as nothing it depends on changes, and is simply never looked up again once something does.
+    Those stale entries are evicted by age and by total size, least recently used first.
+
+    Safe to share between processes: entries are written atomically, and unreadable ones count as misses.
+    """
+
+    def __init__(
+            self,
+            cache_dir,
+            max_bytes=256 * 2 ** 20,
+            max_age=30 * 24 * 60 * 60
+    ):
+        """
+        :param cache_dir: String; folder for cache files, created if needed
+        :param max_bytes: Int or None (no limit); total size of entries to keep
+        :param max_age: Float or None (no limit); seconds since last use after which an entry is evicted
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    @staticmethod
+    def key(
+            *parts
+    ):
+        """
+        :param parts: anything with a repr() that's stable between runs (e.g. Strings, numbers, tuples)
+        :return: String; hash of parts
+        """
+        return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+    def get(
+            self,
+            key
+    ):
+        """
+        :param key: String; see key()
+        :return: cached result, or None if there's none
+        """
+        path = self._path(key)
+        try:
+            result = pd.read_pickle(path)
+        except Exception:
+            return None  # missing, or unreadable (e.g. interrupted write or pandas upgrade)
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return result
+
+    def put(
+            self,
+            key,
+            result
+    ):
+        """
+        Stores result, then evicts stale entries. Best-effort: e.g. a read-only cache folder only means a miss later.
+        :param key: String; see key()
+        :param result: anything picklable
+        """
+        path = self._path(key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            pd.to_pickle(result, tmp_path)
+            os.replace(tmp_path, path)  # atomic, so concurrent readers never see half a file
+            self.evict()
+        except OSError:
+            pass
+
+    def evict(self):
+        """
+        Removes entries unused for longer than max_age, then least recently used entries until the rest fit in
+        max_bytes.
+        """
+        entries = []
+        for path in glob.glob(os.path.join(glob.escape(self.cache_dir), "*.pkl")):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue  # removed by another process
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort(reverse=True)  # most recently used first
+
+        now, total = time.time(), 0
+        for used, size, path in entries:
+            too_old = self.max_age is not None and now - used > self.max_age
+            too_big = self.max_bytes is not None and total + size > self.max_bytes
+            if too_old or too_big:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            else:
+                total += size
+
+    def clear(self):
+        """
+        Removes every entry.
+        """
+        for path in glob.glob(os.path.join(glob.escape(self.cache_dir), "*.pkl")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _path(
+            self,
+            key
+    ):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
@@ -0,0 +1,221 @@
+"""
+Association rules stored as NumPy arrays, decoded into DataFrames of frozensets only on demand.
+"""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+# Columns holding itemsets (frozensets) in tables of rules, e.g. from mlxtend's association_rules()
+ITEMSET_COLUMNS = ["antecedents", "consequents"]
+
+
+class RuleArrays:
+    """
+    A table of rules, column by column: antecedents and consequents as item ids in compressed sparse row (CSR)
+    form, like EncodedColumn (the ids of rule i's antecedents are ids["antecedents"][indptr["antecedents"][i]:
+    indptr["antecedents"][i + 1]]), referring to positions in one vocabulary of items shared by both; every other
+    column (support, confidence, ...) as an array of its own.
+
+    Filtering, sorting and taking rows only touch these arrays, and a rule's itemsets cost a few bytes per item
+    instead of a frozenset each. decode() and to_frame() make frozensets for as many rules as asked for.
+    """
+
+    def __init__(
+            self,
+            items,
+            indptr,
+            ids,
+            columns,
+            index=None
+    ):
+        """
+        :param items: Object array; vocabulary of items
+        :param indptr: Dict of itemset column name (see ITEMSET_COLUMNS) to Int array; rule offsets into ids,
+            with one more element than there are rules
+        :param ids: Dict of itemset column name to Int array; item ids of all rules, one rule after another
+        :param columns: Dict of column name to array (None for itemset columns); every column, in table order
+        :param index: Array or None (0 to number of rules - 1); index labels of rules
+        """
+        self.items = items
+        self.indptr = indptr
+        self.ids = ids
+        self.columns = columns
+        self.index = index
+
+    @classmethod
+    def from_frame(
+            cls,
+            df
+    ):
+        """
+        :param df: DataFrame; a table of rules, with itemset columns holding frozensets (or other iterables)
+        :return: RuleArrays
+        """
+        itemset_columns = [c for c in df.columns if c in ITEMSET_COLUMNS]
+        flattened = {c: list(itertools.chain.from_iterable(df[c])) for c in itemset_columns}
+        flat = pd.Series(list(itertools.chain.from_iterable(flattened.values())), dtype=object)
+        codes, items = pd.factorize(flat)
+        dtype = np.int16 if len(items) < np.iinfo(np.int16).max else np.int32
+
+        indptr, ids, start = dict(), dict(), 0
+        for c in itemset_columns:
+            indptr[c] = np.zeros(len(df) + 1, dtype=np.int64)
+            np.cumsum(np.fromiter((len(itemset) for itemset in df[c]), dtype=np.int64, count=len(df)),
+                      out=indptr[c][1:])
+            ids[c] = codes[start:start + len(flattened[c])].astype(dtype)
+            start += len(flattened[c])
+
+        columns = {c: None if c in itemset_columns else df[c].to_numpy() for c in df.columns}
+        index = None if isinstance(df.index, pd.RangeIndex) and df.index.equals(pd.RangeIndex(len(df))) \
+            else df.index.to_numpy()
+        return cls(np.asarray(items, dtype=object), indptr, ids, columns, index)
+
+    def __len__(self):
+        if self.indptr:
+            return len(next(iter(self.indptr.values()))) - 1
+        if self.columns:
+            return len(next(iter(self.columns.values())))
+        return 0 if self.index is None else len(self.index)
+
+    def column(
+            self,
+            name
+    ):
+        """
+        :param name: String; name of a column that isn't an itemset column
+        :return: array
+        """
+        return self.columns[name]
+
+    def lengths(
+            self,
+            name
+    ):
+        """
+        :param name: String; name of an itemset column
+        :return: Int array; number of items in each rule's itemset
+        """
+        return np.diff(self.indptr[name])
+
+    def take(
+            self,
+            positions,
+            keep_index=True
+    ):
+        """
+        :param positions: Int array; positions of rules, in the order wanted
+        :param keep_index: Bool; whether rules keep their index labels, or are numbered from 0 again
+        :return: RuleArrays; of those rules
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        indptr, ids = dict(), dict()
+        for c in self.indptr:
+            starts, lengths = self.indptr[c][positions], self.lengths(c)[positions]
+            indptr[c] = np.zeros(len(positions) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=indptr[c][1:])
+            # Position of every id to take: its rule's start, plus its place within the rule
+            gathered = np.repeat(starts - indptr[c][:-1], lengths) + np.arange(indptr[c][-1])
+            ids[c] = self.ids[c][gathered]
+
+        columns = {c: None if values is None else values[positions] for c, values in self.columns.items()}
+        index = None
+        if keep_index:
+            index = positions if self.index is None else self.index[positions]
+        return RuleArrays(self.items, indptr, ids, columns, index)
+
+    def with_columns(
+            self,
+            **arrays
+    ):
+        """
+        :param arrays: arrays parallel to rules, by column name
+        :return: RuleArrays; these rules, with the columns added at the end (or replaced)
+        """
+        return RuleArrays(self.items, self.indptr, self.ids, {**self.columns, **arrays}, self.index)
+
+    def sort_order(
+            self,
+            by,
+            ascending
+    ):
+        """
+        Orders rules like DataFrame.sort_values() orders their table, including among ties: by a single column
+        with the same (unstable) quicksort, and by several stably.
+        :param by: List of Strings; names of columns that aren't itemset columns
+        :param ascending: List of Bools; parallel to by
+        :return: Int array; positions of rules in sorted order
+        """
+        if any(self.columns.get(c, 0) is None for c in by):
+            raise ValueError(f"invalid sort_by argument: can't sort by {ITEMSET_COLUMNS}")
+        if len(by) == 1:
+            return self._nargsort(self.columns[by[0]], bool(ascending[0]))
+
+        keys = []
+        for c, asc in zip(by, ascending):
+            values = self.columns[c]
+            uniques, codes = np.unique(values, return_inverse=True)
+            codes = codes.reshape(-1).astype(np.int64)
+            if not asc:
+                codes = len(uniques) - 1 - codes
+            codes[pd.isna(values)] = len(uniques)  # missing values last either way
+            keys.append(codes)
+        return np.lexsort(keys[::-1])
+
+    def postings(
+            self,
+            name
+    ):
+        """
+        Inverted index from each item to the positions of rules that have it in an itemset column.
+        :param name: String; name of an itemset column
+        :return: Dict of item to Int array
+        """
+        rules = np.repeat(np.arange(len(self)), self.lengths(name))
+        order = np.argsort(self.ids[name], kind="stable")  # so each item's rules stay in ascending order
+        ids, rules = self.ids[name][order], rules[order]
+        boundaries = np.flatnonzero(np.diff(ids)) + 1
+        starts = np.concatenate([[0], boundaries]) if len(ids) else boundaries
+        return {self.items[ids[s]]: r for s, r in zip(starts, np.split(rules, boundaries))}
+
+    def decode(
+            self,
+            name
+    ):
+        """
+        :param name: String; name of an itemset column
+        :return: Object array of frozensets; each rule's itemset
+        """
+        items = self.items[self.ids[name]].tolist()
+        indptr = self.indptr[name].tolist()
+        itemsets = np.empty(len(indptr) - 1, dtype=object)  # object dtype even if there are no rules
+        itemsets[:] = [frozenset(items[start:end]) for start, end in zip(indptr[:-1], indptr[1:])]
+        return itemsets
+
+    def to_frame(self):
+        """
+        :return: DataFrame; the table of rules, with frozensets in itemset columns
+        """
+        data = {c: self.decode(c) if values is None else values for c, values in self.columns.items()}
+        index = pd.RangeIndex(len(self)) if self.index is None else pd.Index(self.index)
+        return pd.DataFrame(data, index=index, columns=list(self.columns))
+
+    @staticmethod
+    def _nargsort(
+            values,
+            ascending
+    ):
+        """
+        Same order as pandas' single-column sort: missing values last, and ties in the order quicksort leaves
+        them, which for descending sorts is that of the reversed values, reversed.
+        """
+        missing = pd.isna(values)
+        positions = np.arange(len(values))
+        present, present_positions = values[~missing], positions[~missing]
+        if not ascending:
+            present, present_positions = present[::-1], present_positions[::-1]
+        order = present_positions[present.argsort(kind="quicksort")]
+        if not ascending:
+            order = order[::-1]
+        return np.concatenate([order, positions[missing]])
@@ -0,0 +1,252 @@
+"""
+Runs the ready-made plotting and mining methods as batch jobs, in parallel.
+"""
+
+import ast
+import fnmatch
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+import matplotlib.pyplot as plt
+
+from exporters import Exporter
+from instrumentation import Instrumentation, JsonLinesSink
+from miner import AssociationMiner
+from plotters import PandasPlotter
+from resultcache import ResultCache
+from snsplotters import HeatMapPlotter
+
+# Classes with ready-made methods, the prefix of those methods, and where (under the output folder) they export
+# tables and figures to (None if they make no figures)
+JOB_CLASSES = [
+    (PandasPlotter, "plot_", "csv-pandas", "pyplot-bar"),
+    (HeatMapPlotter, "draw_", "csv-heatmap", "pyplot-heatmap"),
+    (AssociationMiner, "mine_", "csv-mined", None)
+]
+
+# Extra arguments that jobs are also run with when selected by name alone; jobs not listed run once, with defaults
+JOB_VARIANTS = {
+    "mine_favorite_character_reasons": [{"antecedent": "character"}, {"antecedent": "reason"}],
+    # Core regions only (region_vs_* figures), besides every region (full_region_vs_* figures)
+    "plot_music_band_by_region": [{"show_all": False}],
+    "plot_chara_band_by_region": [{"show_all": False}],
+    "plot_play_style_by_region": [{"show_all": False}],
+    "plot_participation_by_region": [{"show_all": False}]
+}
+
+# Per worker process state, set up by _init_worker()
+_dataset = None
+_output_dir = None
+_profile_path = None
+_export_formats = None
+_result_cache_dir = None
+_instances = dict()
+
+
+class Job:
+    """
+    One call of a ready-made method.
+    """
+
+    def __init__(
+            self,
+            method,
+            kwargs=None
+    ):
+        """
+        :param method: String; name of ready-made method
+        :param kwargs: Dict or None; keyword arguments to call it with
+        """
+        self.method = method
+        self.kwargs = kwargs or dict()
+
+    @property
+    def name(self):
+        """
+        :return: String; e.g. "mine_favorite_character_reasons:antecedent=reason"
+        """
+        args = ",".join(f"{k}={v}" for k, v in self.kwargs.items())
+        return f"{self.method}:{args}" if args else self.method
+
+    @classmethod
+    def parse(
+            cls,
+            name
+    ):
+        """
+        :param name: String; method name, optionally followed by ":key=value,key=value"
+            (values are Python literals, or Strings if they aren't one)
+        :return: Job
+        """
+        method, _, args = name.partition(":")
+        kwargs = dict()
+        for arg in filter(None, args.split(",")):
+            key, _, value = arg.partition("=")
+            try:
+                kwargs[key] = ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                kwargs[key] = value
+        return cls(method, kwargs)
+
+
+class JobResult:
+    """
+    Outcome of running a Job.
+    """
+
+    def __init__(
+            self,
+            job,
+            elapsed,
+            error=None
+    ):
+        """
+        :param job: Job
+        :param elapsed: Float; wall time in seconds
+        :param error: String or None; traceback, if the job failed
+        """
+        self.job = job
+        self.elapsed = elapsed
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def discover_jobs():
+    """
+    Finds all ready-made methods.
+    :return: Dict of method name to (class, export folder, figure folder)
+    """
+    methods = dict()
+    for cls, prefix, folder, figure_folder in JOB_CLASSES:
+        for name in sorted(vars(cls)):
+            if name.startswith(prefix) and callable(getattr(cls, name)):
+                methods[name] = (cls, folder, figure_folder)
+    return methods
+
+
+def select_jobs(
+        patterns=None
+):
+    """
+    :param patterns: List of Strings or None (everything); method names or shell-style patterns (e.g. "mine_*"),
+        optionally with arguments (see Job.parse())
+    :return: List of Jobs
+    :raises ValueError: if a pattern matches no method
+    """
+    methods = discover_jobs()
+    jobs = []
+    for pattern in patterns or ["*"]:
+        job = Job.parse(pattern)
+        matches = fnmatch.filter(methods, job.method)
+        if not matches:
+            raise ValueError(f"no ready-made method matches '{job.method}'")
+        for method in matches:
+            if job.kwargs:
+                jobs.append(Job(method, job.kwargs))
+            else:
+                jobs.extend(Job(method, kwargs) for kwargs in [None] + JOB_VARIANTS.get(method, []))
+    return list({job.name: job for job in jobs}.values())  # drop duplicates, keep order
+
+
+def run_jobs(
+        jobs,
+        dataset,
+        output_dir,
+        workers=None,
+        on_result=None,
+        profile_path=None,
+        export_formats=("csv",),
+        result_cache_dir=None
+):
+    """
+    Runs jobs concurrently on a process pool. Every worker shares the same loaded dataset
+    (inherited without copying where processes are forked). Plots are saved as PNGs rather than shown.
+    :param jobs: List of Jobs
+    :param dataset: SurveyDataset
+    :param output_dir: String; folder to export into (see JOB_CLASSES for subfolders)
+    :param workers: Int or None; number of processes, defaults to number of CPUs
+    :param on_result: Function or None; called with each JobResult as soon as it finishes
+    :param profile_path: String or None; if given, the stages of every mining job are measured, and appended to
+        this file as JSON lines (see AssociationMiner.instrument())
+    :param export_formats: List of Strings; formats to export mined rules in (see exporters.WRITERS)
+    :param result_cache_dir: String or None; if given, mining jobs reuse rules cached in this folder by earlier
+        runs, when nothing they depend on changed (see ResultCache)
+    :return: List of JobResults, in order of jobs
+    """
+    output_dir = os.path.abspath(output_dir)
+    profile_path = os.path.abspath(profile_path) if profile_path else None
+    for _, _, folder, _ in JOB_CLASSES:
+        os.makedirs(os.path.join(output_dir, folder), exist_ok=True)
+
+    methods = list(multiprocessing.get_all_start_methods())
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    results = dict()
+
+    with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(dataset, output_dir, profile_path, export_formats, result_cache_dir)
+    ) as pool:
+        futures = {pool.submit(_run_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            result = future.result()
+            results[result.job.name] = result
+            if on_result is not None:
+                on_result(result)
+
+    return [results[job.name] for job in jobs]
+
+
+def _init_worker(
+        dataset,
+        output_dir,
+        profile_path,
+        export_formats,
+        result_cache_dir
+):
+    global _dataset, _output_dir, _profile_path, _export_formats, _result_cache_dir
+    matplotlib.use("Agg")  # never open windows (or block on them) in workers
+    _dataset = dataset
+    _output_dir = output_dir
+    _profile_path = profile_path
+    _export_formats = export_formats
+    _result_cache_dir = result_cache_dir
+
+
+def _run_job(
+        job
+):
+    """
+    :param job: Job
+    :return: JobResult
+    """
+    start = time.perf_counter()
+    try:
+        cls, folder, figure_folder = discover_jobs()[job.method]
+        if cls not in _instances:
+            kwargs = {"figure_dir": os.path.join(_output_dir, figure_folder)} if figure_folder else dict()
+            if cls is AssociationMiner:
+                kwargs["exporter"] = Exporter(os.path.join(_output_dir, folder), formats=_export_formats)
+                if _result_cache_dir:
+                    kwargs["result_cache"] = ResultCache(_result_cache_dir)
+                if _profile_path:
+                    kwargs["instrumentation"] = Instrumentation([JsonLinesSink(_profile_path)])
+            _instances[cls] = cls(_dataset, export_to_csv=True, **kwargs)
+        os.chdir(os.path.join(_output_dir, folder))  # plotters export tables to the working directory
+        getattr(_instances[cls], job.method)(**job.kwargs)
+        if cls is AssociationMiner:
+            _instances[cls].exporter.flush()  # so the job only succeeds once its rules are written
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        plt.close("all")
+    return JobResult(job, time.perf_counter() - start, error)
@@ -7,7 +7,9 @@ import pandas as pd
 import matplotlib.pyplot as plt
 
 from constants import *
-from helpers import DataCleaner
+from counts import CountCube
+from dataset import SurveyDataset
+from plotters import FigureExporter
 
 
 class HeatMapPlotter:
@@ -18,10 +20,20 @@ class HeatMapPlotter:
     def __init__(
             self,
             tsv_path,
-            export_to_csv=False
+            export_to_csv=False,
+            figure_dir=None,
+            figure_format="png"
     ):
-        self.df = DataCleaner.prepare_data_frame(tsv_path)
+        """
+        :param tsv_path: String (path to survey responses) or SurveyDataset
+        :param export_to_csv: Bool; whether to also export frequency tables to CSV
+        :param figure_dir: String or None; if given, heat maps are saved in this folder instead of shown
+        :param figure_format: String; file format of saved heat maps, e.g. "png" or "svg"
+        """
+        self.dataset = SurveyDataset.load(tsv_path)
+        self.df = self.dataset.df
         self.export_to_csv = export_to_csv
+        self.figure_exporter = FigureExporter(figure_dir, figure_format) if figure_dir else None
 
     def draw(
             self,
@@ -72,31 +84,22 @@ class HeatMapPlotter:
         """
         Cell annotations are percentage in region.
         """
-        df = DataCleaner.filter_gender(self.df)
-        df = DataCleaner.filter_region(df)
-        self._draw(
-            df, REGION, GENDER, normalize="index", border="horizontal", export_name="gender-vs-region"
-        )
+        counts = self.dataset.counts.crosstab(REGION, GENDER)
+        self._draw_counts(counts, normalize="index", border="horizontal", export_name="gender-vs-region")
 
     def draw_age_vs_region(self):
         """
         Cell annotations are percentage in region.
         """
-        df = DataCleaner.filter_age(self.df)
-        df = DataCleaner.filter_region(df)
-        self._draw(
-            df, REGION, AGE, normalize="index", border="horizontal", export_name="age-vs-region"
-        )
+        counts = self.dataset.counts.crosstab(REGION, AGE)
+        self._draw_counts(counts, normalize="index", border="horizontal", export_name="age-vs-region")
 
     def draw_age_vs_gender(self):
         """
         Cell annotations are percentage in age.
         """
-        df = DataCleaner.filter_age(self.df)
-        df = DataCleaner.filter_gender(df)
-        self._draw(
-            df, AGE, GENDER, normalize="index", border="horizontal", export_name="age-vs-gender"
-        )
+        counts = self.dataset.counts.crosstab(AGE, GENDER)
+        self._draw_counts(counts, normalize="index", border="horizontal", export_name="age-vs-gender")
 
     def _draw(
             self,
@@ -112,12 +115,25 @@ class HeatMapPlotter:
         Private, general method to create frequency table and plot.
         Also exports to file, if applicable.
         """
-        counts = pd.crosstab(df[x], df[y], normalize=normalize)
-        counts_raw = pd.crosstab(df[x], df[y]) if normalize else None
-        self._plot_heat_map(counts, border=border, fmt=fmt)
+        self._draw_counts(pd.crosstab(df[x], df[y]), normalize, border, fmt=fmt, export_name=export_name)
+
+    def _draw_counts(
+            self,
+            counts_raw,
+            normalize,
+            border,
+            fmt=".2g",
+            export_name="export"
+    ):
+        """
+        Private, general method to plot a frequency table, normalized as pd.crosstab() would.
+        Also exports to file, if applicable.
+        """
+        counts = CountCube.normalize(counts_raw, normalize)
+        self._plot_heat_map(counts, border=border, fmt=fmt, figure_name=export_name.replace("-", "_") or "heat_map")
 
         if self.export_to_csv:
-            if counts_raw is not None:
+            if normalize:
                 counts.to_csv(f"{export_name}.normalized.csv")
                 counts_raw.to_csv(f"{export_name}.raw.csv")
             else:
@@ -128,7 +144,8 @@ class HeatMapPlotter:
             counts,
             cmap="BuGn",
             border=None,
-            fmt=".2g"
+            fmt=".2g",
+            figure_name="heat_map"
     ):
         """
         Draws heat map for frequency table.
@@ -136,9 +153,16 @@ class HeatMapPlotter:
         :param cmap: color map to use. See https://chrisalbon.com/python/data_visualization/seaborn_color_palettes/
         :param border: "horizontal", "vertical", or None: which borders between rows and/or columns to draw
         :param fmt: https://docs.python.org/3/library/string.html#format-specification-mini-language
+        :param figure_name: String; file name (without extension) to save as, if saving figures
         """
-        ax = sns.heatmap(counts, annot=True, fmt=fmt, cmap=cmap)
-        self._fix_heat_map()
+        ax = sns.heatmap(
+            counts,
+            annot=True,
+            fmt=fmt,
+            cmap=cmap,
+            ax=self.figure_exporter.new_axes() if self.figure_exporter else None
+        )
+        self._fix_heat_map(ax)
 
         if border is None:
             pass
@@ -149,16 +173,20 @@ class HeatMapPlotter:
         else:
             raise ValueError("invalid 'border' argument")
 
-        plt.show()
+        if self.figure_exporter:
+            self.figure_exporter.save(ax.figure, figure_name)
+        else:
+            plt.show()
 
     @staticmethod
-    def _fix_heat_map():
+    def _fix_heat_map(ax):
         """
         Fixes Seaborn bug that crops top/bottom of heat map on show
         https://github.com/mwaskom/seaborn/issues/1773#issuecomment-546466986
+        :param ax: Axes of the heat map
         """
         # fix for mpl bug that cuts off top/bottom of seaborn viz
-        b, t = plt.ylim()  # discover the values for bottom and top
+        b, t = ax.get_ylim()  # discover the values for bottom and top
         b += 0.5  # Add 0.5 to the bottom
         t -= 0.5  # Subtract 0.5 from the top
-        plt.ylim(b, t)  # update the ylim(bottom, top) values
+        ax.set_ylim(b, t)  # update the ylim(bottom, top) values
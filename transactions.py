@@ -0,0 +1,200 @@
+"""
+Encoded multi-response answers, for mining frequent itemsets without re-parsing responses.
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+from helpers import DataCleaner, ResponseParser
+
+
+class EncodedColumn:
+    """
+    The answers of one column, stored as item ids in compressed sparse row (CSR) form:
+    the item ids of response i are indices[indptr[i]:indptr[i + 1]], and refer to positions in items.
+    """
+
+    def __init__(
+            self,
+            items,
+            indptr,
+            indices,
+            valid
+    ):
+        """
+        :param items: List of Strings; legal values of the column
+        :param indptr: Int array; row offsets into indices, with one more element than there are responses
+        :param indices: Int array; item ids of all responses, one response after another
+        :param valid: Bool array; whether each response is valid (see DataCleaner.valid_mask())
+        """
+        self.items = items
+        self.indptr = indptr
+        self.indices = indices
+        self.valid = valid
+
+    @classmethod
+    def from_indicators(
+            cls,
+            items,
+            indicators,
+            valid
+    ):
+        """
+        :param items: List of Strings
+        :param indicators: 2D Bool array; one row per response, one column per item
+        :param valid: Bool array
+        :return: EncodedColumn
+        """
+        rows, indices = np.nonzero(indicators)  # row-major, so already grouped by response
+        indptr = np.zeros(len(indicators) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(indicators)), out=indptr[1:])
+        dtype = np.int16 if len(items) < np.iinfo(np.int16).max else np.int32
+        return cls(items, indptr, indices.astype(dtype), valid)
+
+    @property
+    def row_ids(self):
+        """
+        :return: Int array; parallel to indices, the response each item id belongs to
+        """
+        return np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+
+    @property
+    def counts(self):
+        """
+        :return: Int array; parallel to items, how many times each was given
+        """
+        return np.bincount(self.indices, minlength=len(self.items))
+
+    def items_given(
+            self,
+            rows=None
+    ):
+        """
+        :param rows: Bool array or None (all); which responses to look at
+        :return: List of Strings; items given in those responses, in order of first appearance
+        """
+        ids = self.indices if rows is None else self.indices[rows[self.row_ids]]
+        return [self.items[i] for i in pd.unique(ids)]
+
+
+class TransactionStore:
+    """
+    Parses multi-response columns into EncodedColumns once, and stacks any combination of them into
+    the one-hot encoded tables needed for frequent itemset mining.
+    """
+
+    def __init__(
+            self,
+            df
+    ):
+        """
+        :param df: DataFrame of responses; treated as read-only
+        """
+        self.df = df
+        self._columns = dict()
+        self._tokens = dict()
+
+    def encode(
+            self,
+            column,
+            column_values
+    ):
+        """
+        :param column: column name
+        :param column_values: List of Strings; legal values of the column
+        :return: EncodedColumn; memoized per column and legal values
+        """
+        key = (column, tuple(column_values))
+        if key not in self._columns:
+            self._columns[key] = EncodedColumn.from_indicators(
+                list(column_values),
+                ResponseParser.answer_indicators(self.df[column], column_values),
+                DataCleaner.valid_mask(self.df, column)
+            )
+        return self._columns[key]
+
+    def tokens(
+            self,
+            column
+    ):
+        """
+        All answers of a multi-response column, split up without knowing the legal values in advance
+        (see ResponseParser.tokenize()).
+        :param column: column name
+        :return: EncodedColumn; items are every answer given, in order of first appearance; memoized per column
+        """
+        if column not in self._tokens:
+            answers, indptr, indices = ResponseParser.tokenize(self.df[column])
+            self._tokens[column] = EncodedColumn(answers, indptr, indices, DataCleaner.valid_mask(self.df, column))
+        return self._tokens[column]
+
+    def one_hot(
+            self,
+            columns,
+            column_values,
+            sparse=False
+    ):
+        """
+        Stacks encoded columns into a one-hot encoded DataFrame, with one row per response that is valid in every
+        column, and one column per item (sorted by name, and only if someone gave it).
+        The same item found in multiple columns is merged into one column.
+
+        A sparse DataFrame only stores the items each response has, so its memory grows with the number of answers
+        given rather than with responses times items. It's made without ever making the dense table.
+
+        :param columns: List of column names
+        :param column_values: List; each element is itself a list, holding the legal values of the column
+        :param sparse: Bool; whether to make a sparse DataFrame (see pd.DataFrame.sparse)
+        :return: DataFrame of Bools
+        """
+        encoded = [self.encode(c, v) for c, v in zip(columns, column_values)]
+
+        keep = np.ones(len(self.df), dtype=bool)
+        for e in encoded:
+            keep &= e.valid
+        new_row = np.cumsum(keep) - 1  # position of each kept response in the output
+        n_rows = int(keep.sum())
+
+        # Sort by raw name (like mlxtend's TransactionEncoder), then merge names that are equal once parsed
+        raw_names = sorted(set(item for e in encoded for item in e.items))
+        names = list(dict.fromkeys(self.item_name(name) for name in raw_names))
+        parsed_ids = {name: i for i, name in enumerate(names)}
+        name_ids = {raw: parsed_ids[self.item_name(raw)] for raw in raw_names}
+
+        # Positions of every True cell, as flat indexes into the table
+        cells = [np.empty(0, dtype=np.int64)]
+        for e in encoded:
+            rows = e.row_ids
+            in_kept = keep[rows]
+            item_to_name = np.array([name_ids[item] for item in e.items], dtype=np.int64)
+            cells.append(new_row[rows[in_kept]] * len(names) + item_to_name[e.indices[in_kept]])
+        cells = np.unique(np.concatenate(cells))  # merged items may be given in more than one column
+        rows, items = np.divmod(cells, len(names)) if len(names) else (cells, cells)
+
+        # Like TransactionEncoder, only include items someone gave
+        seen = np.bincount(items, minlength=len(names)) > 0
+        seen_names = [name for name, s in zip(names, seen) if s]
+        items = (np.cumsum(seen) - 1)[items]
+
+        if sparse:
+            matrix = scipy.sparse.csc_matrix(
+                (np.ones(len(cells), dtype=bool), (rows, items)), shape=(n_rows, len(seen_names))
+            )
+            return pd.DataFrame.sparse.from_spmatrix(matrix, columns=seen_names)
+
+        array = np.zeros((n_rows, len(seen_names)), dtype=bool)
+        array[rows, items] = True
+        return pd.DataFrame(array, columns=seen_names)
+
+    @staticmethod
+    def item_name(
+            value
+    ):
+        """
+        Name of the item (i.e. one-hot column) for a legal value.
+        Removes quotes, because Pandas doesn't like them in column names.
+        :param value: String
+        :return: String
+        """
+        return value.replace('"', '')